@@ -0,0 +1,79 @@
+"""
+Import-time profile of the app, using `python -X importtime -c "import main"`
+in a fresh interpreter. Prints the total and the heaviest top-level imports,
+and exits non-zero when the total exceeds --max-ms so it can gate CI.
+
+Needs the same environment variables as the app (e.g. from .env), since
+importing main loads the config. Run from backend/:
+    python benchmarks/bench_import.py --runs 5 --max-ms 1500
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+
+def profile_import(module: str) -> tuple[int, dict[str, int]]:
+    """
+    Total import time of module and the cumulative time of each import it
+    triggers directly, both in microseconds
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    total = 0
+    children: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line.removeprefix("import time:").split("|")
+        if not cumulative_us.strip().isdigit():
+            continue  # header row
+        # Each nesting level is indented by two more spaces
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0 and name.strip() == module:
+            total = int(cumulative_us)
+        elif depth == 1:
+            children[name.strip()] = int(cumulative_us)
+    return total, children
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    runs = [profile_import(args.module) for _ in range(args.runs)]
+    totals_ms = [total / 1000 for total, _ in runs]
+    median_ms = statistics.median(totals_ms)
+
+    heaviest = sorted(runs[-1][1].items(), key=lambda item: item[1], reverse=True)
+    print(f"{'imported by ' + args.module:<40}{'cumulative ms':>14}")
+    for name, cumulative_us in heaviest[: args.top]:
+        print(f"{name:<40}{cumulative_us / 1000:>14.1f}")
+    print(
+        f"\nimport {args.module}: median {median_ms:.1f} ms "
+        f"(min {min(totals_ms):.1f}, max {max(totals_ms):.1f}) over {args.runs} runs"
+    )
+
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print(f"FAIL: exceeds budget of {args.max_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
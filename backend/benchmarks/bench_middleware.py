@@ -0,0 +1,92 @@
+"""
+Per-request overhead of the interceptor on the `/` route, comparing the
+previous @app.middleware("http") registration (Starlette's
+BaseHTTPMiddleware) with the raw ASGI CustomInterceptor.
+
+Run from backend/:
+    python benchmarks/bench_middleware.py -n 20000
+"""
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from fastapi import FastAPI, Request  # noqa: E402
+from middleware.custom_interceptor import CustomInterceptor  # noqa: E402
+
+SCOPE = {
+    "type": "http",
+    "asgi": {"version": "3.0"},
+    "http_version": "1.1",
+    "method": "GET",
+    "scheme": "http",
+    "path": "/",
+    "raw_path": b"/",
+    "root_path": "",
+    "query_string": b"",
+    "headers": [(b"host", b"bench")],
+    "client": ("127.0.0.1", 50000),
+    "server": ("bench", 80),
+}
+
+
+def build_app(kind: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/")
+    async def root():
+        return {"detail": "DevTeamer API"}
+
+    if kind == "base_http":
+
+        @app.middleware("http")
+        async def _custom_interceptor(request: Request, call_next):
+            if request.url.path in ["/", "/docs", "/openapi.json"]:
+                return await call_next(request)
+            raise AssertionError("benchmark only hits excluded paths")
+
+    elif kind == "asgi":
+        app.add_middleware(CustomInterceptor)
+
+    return app
+
+
+async def _receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def _send(message):
+    pass
+
+
+async def measure(app: FastAPI, requests: int) -> float:
+    """Mean seconds per request, calling the ASGI app directly"""
+    for _ in range(min(requests, 1000)):
+        await app(dict(SCOPE), _receive, _send)
+
+    start = perf_counter()
+    for _ in range(requests):
+        await app(dict(SCOPE), _receive, _send)
+    return (perf_counter() - start) / requests
+
+
+async def main(requests: int):
+    results = {}
+    for kind in ("none", "base_http", "asgi"):
+        results[kind] = await measure(build_app(kind), requests)
+
+    baseline = results["none"]
+    print(f"{'middleware':<12}{'us/request':>12}{'overhead us':>14}")
+    for kind, seconds in results.items():
+        print(f"{kind:<12}{seconds * 1e6:>12.1f}{(seconds - baseline) * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--requests", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,82 @@
+"""
+Serialization cost of a BaseResponse[UserRead] body, comparing the previous
+JSONResponse(content=model_dump()) rendering with ModelJSONResponse, which
+hands the model to pydantic-core and gets bytes back. Also checks that both
+produce the same body.
+
+Run from backend/:
+    python benchmarks/bench_response.py -n 50000
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from models.response import BaseResponse, ModelJSONResponse  # noqa: E402
+from models.user import UserRead  # noqa: E402
+
+
+def build_body(users: int) -> BaseResponse:
+    rows = [
+        UserRead(
+            id=i,
+            email=f"user{i}@example.com",
+            username=f"user{i}",
+            first_name="Jörg",
+            last_name="Example",
+            verified=bool(i % 2),
+        )
+        for i in range(users)
+    ]
+    if users == 1:
+        return BaseResponse[UserRead].ok(data=rows[0])
+    return BaseResponse[list[UserRead]].ok(data=rows, meta={"next_cursor": users})
+
+
+RENDERERS = {
+    "model_dump+json": lambda body: JSONResponse(
+        status_code=body.status, content=body.model_dump()
+    ),
+    "pydantic-core": lambda body: ModelJSONResponse(
+        status_code=body.status, content=body
+    ),
+}
+
+
+def measure(render, body: BaseResponse, requests: int) -> float:
+    """Mean seconds per response"""
+    for _ in range(min(requests, 1000)):
+        render(body)
+    start = perf_counter()
+    for _ in range(requests):
+        render(body)
+    return (perf_counter() - start) / requests
+
+
+def main(requests: int):
+    print(f"{'body':<16}{'renderer':<18}{'us/response':>12}{'speedup':>9}")
+    for label, users in (("1 user", 1), ("50 users", 50)):
+        body = build_body(users)
+        outputs = {name: render(body).body for name, render in RENDERERS.items()}
+        assert len(set(outputs.values())) == 1, f"renderers disagree for {label}"
+
+        baseline = None
+        for name, render in RENDERERS.items():
+            seconds = measure(render, body, requests if users == 1 else requests // 10)
+            baseline = baseline or seconds
+            print(
+                f"{label:<16}{name:<18}{seconds * 1e6:>12.1f}"
+                f"{baseline / seconds:>8.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--requests", type=int, default=50000)
+    args = parser.parse_args()
+    main(args.requests)
@@ -0,0 +1,146 @@
+"""
+Counts SQL statements, pool checkouts, JWT verifications and user lookups
+per request for the auth and users endpoints, running the app in-process like load_test.py.
+Exits non-zero if any request verifies the same token, or looks up the same
+user, more than once. Requests that also carry an access_token cookie are
+included, since that is when the auth dependencies and the route body
+resolve the same user. Checkouts are counted separately from statements:
+a request served from cache should show none, since a checkout (and its
+pre-ping) costs a round trip even when no statement runs.
+
+Run from backend/:
+    python benchmarks/count_queries.py
+"""
+
+import asyncio
+import sys
+from collections import Counter
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from load_test import PASSWORD, in_process_app
+
+
+class Counts:
+
+    def __init__(self):
+        self.statements = 0
+        self.checkouts = 0
+        self.verifies: Counter[str | None] = Counter()
+        self.lookups: Counter[str] = Counter()
+
+    def reset(self):
+        self.__init__()
+
+
+def instrument(counts: Counts):
+    """Wraps the functions lib.auth resolves identities with"""
+    from sqlalchemy import event
+
+    from lib import auth
+    from services import pg_client
+
+    parse_jwt, get_user = auth.parse_jwt, auth.get_user
+
+    def counting_parse_jwt(token):
+        if token:
+            counts.verifies[token] += 1
+        return parse_jwt(token)
+
+    async def counting_get_user(session, identifier, use_cache=True):
+        # Logins re-read a cached user from the DB for its password hash,
+        # so cached and uncached lookups are counted apart
+        key = identifier.lower() if use_cache else f"{identifier.lower()} (db)"
+        counts.lookups[key] += 1
+        return await get_user(session, identifier, use_cache)
+
+    def count_statement(*_):
+        counts.statements += 1
+
+    def count_checkout(*_):
+        counts.checkouts += 1
+
+    auth.parse_jwt = counting_parse_jwt
+    auth.get_user = counting_get_user
+    event.listen(pg_client.engine.sync_engine, "before_cursor_execute", count_statement)
+    event.listen(pg_client.engine.sync_engine, "checkout", count_checkout)
+
+
+def _token(response: httpx.Response) -> str:
+    return parse_qs(urlparse(response.json()["detail"]).query)["token"][0]
+
+
+async def main() -> int:
+    counts = Counts()
+    rows = []
+
+    async with in_process_app() as app:
+        from services.rate_limit import _cooldown_key
+        from services.redis_client import redis_client
+
+        instrument(counts)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://q") as c:
+
+            async def call(label: str, method: str, url: str, **kwargs):
+                counts.reset()
+                response = await c.request(method, url, **kwargs)
+                rows.append((label, response.status_code, counts.statements,
+                             counts.checkouts, counts.verifies.copy(),
+                             counts.lookups.copy()))  # fmt: skip
+                return response
+
+            user = {
+                "email": "counter@example.com",
+                "username": "counter",
+                "first_name": "Query",
+                "last_name": "Counter",
+                "password": PASSWORD,
+            }
+            response = await call("register", "POST", "/auth/register", json=user)
+            verify_token = _token(response)
+            await call("verify", "GET", "/auth/verify", params={"token": verify_token})
+            login = {"username": "counter", "password": PASSWORD}
+            response = await call("login", "POST", "/auth/login", data=login)
+            response = await call(
+                "confirm-login", "GET", "/auth/confirm-login",
+                params={"token": _token(response)},
+            )  # fmt: skip
+            c.cookies.set("access_token", response.cookies["access_token"])
+
+            await call("get-current", "GET", "/users/get-current")
+            await call("get-current (again)", "GET", "/users/get-current")
+            await call(
+                "check-exists", "GET", "/users/check-exists",
+                params={"username": "counter"},
+            )  # fmt: skip
+            await call("users/{username}", "GET", "/users/counter")
+            # require_unauthenticated resolves the cookie's user before the body
+            await call(
+                "verify (with cookie)", "GET", "/auth/verify",
+                params={"token": verify_token},
+            )  # fmt: skip
+            # Clear the login cooldown rather than waiting it out
+            await redis_client.r.delete(_cooldown_key(user["email"], "LOGIN"))
+            await call("login (with cookie)", "POST", "/auth/login", data=login)
+            await call("logout", "POST", "/auth/logout")
+
+    print(
+        f"{'request':<24}{'status':>7}{'statements':>12}{'checkouts':>11}"
+        f"{'jwt verifies':>14}{'lookups':>9}"
+    )
+    failed = False
+    for label, status, statements, checkouts, verifies, lookups in rows:
+        flag = ""
+        if any(n > 1 for n in (*verifies.values(), *lookups.values())):
+            flag, failed = "  <- resolved more than once", True
+        print(
+            f"{label:<24}{status:>7}{statements:>12}{checkouts:>11}"
+            f"{verifies.total():>14}{lookups.total():>9}{flag}"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
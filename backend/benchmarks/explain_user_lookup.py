@@ -0,0 +1,59 @@
+"""
+Checks that the case-insensitive user lookups in pg_client are served by
+the lower() indexes, and user search by the trigram indexes, rather than a
+sequential scan of users.
+
+Runs against the database configured in .env, once migrations have been
+applied. Run from backend/:
+    python benchmarks/explain_user_lookup.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from sqlalchemy.dialects import postgresql  # noqa: E402
+from sqlmodel import func, select, text  # noqa: E402
+
+from models import User  # noqa: E402
+from services import pg_client  # noqa: E402
+
+LOOKUPS = {
+    "uq_users_username_lower": select(User).where(
+        func.lower(User.username) == "someone"
+    ),
+    "uq_users_email_lower": select(User).where(
+        func.lower(User.email) == "someone@example.com"
+    ),
+    "ix_users_username_trgm": select(User.id).where(
+        pg_client._search_rank("postgresql", "someone")[1]
+    ),
+}
+
+
+async def main() -> int:
+    failed = 0
+    pg_client.init()
+    engine = pg_client.engine
+    assert engine is not None
+    async with engine.connect() as conn:
+        # Small tables are cheaper to scan; make the planner show its choice
+        await conn.execute(text("SET enable_seqscan = off"))
+        for index, statement in LOOKUPS.items():
+            sql = statement.compile(
+                dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+            )
+            plan = "\n".join(
+                row[0] for row in await conn.execute(text(f"EXPLAIN {sql}"))
+            )
+            ok = index in plan and "Seq Scan" not in plan
+            failed += not ok
+            print(f"{'OK' if ok else 'FAIL'} {index}\n{plan}\n")
+    await engine.dispose()
+    return failed
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,301 @@
+"""
+Load test of the auth and users hot paths. Each virtual user registers,
+verifies, logs in and confirms the login, then calls /users/get-current and
+/users/check-exists --repeat times. Prints p50/p95/p99 latency and throughput
+per endpoint, and exits non-zero when a p95 exceeds --max-p95-ms so it can
+gate CI.
+
+By default the app runs in-process against SQLite and fakeredis
+(`pip install httpx aiosqlite "fakeredis[lua]"`), with the email sink and
+rate limits raised so they don't dominate. --base-url targets a running
+server instead; it must have DEBUG=true (links come back in the response)
+and rate limits high enough for the run. Run from backend/:
+    python benchmarks/load_test.py --users 200 --concurrency 20 --repeat 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from time import perf_counter
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+PASSWORD = "Bench-passw0rd!"
+
+# Only used in-process, where no .env is required
+IN_PROCESS_ENV = {
+    "DEBUG": "true",
+    "ALLOW_ORIGINS": "http://127.0.0.1:3000",
+    "SECRET_KEY": "bench",
+    "PG_USER": "bench",
+    "PG_PASSWORD": "bench",
+    "PG_HOST": "localhost",
+    "PG_PORT": "5432",
+    "PG_NAME": "bench",
+    "REDIS_HOST": "localhost",
+    "REDIS_PORT": "6379",
+    "REDIS_PASSWORD": "bench",
+    "REDIS_DB": "0",
+    "EMAIL_ADDRESS": "bench@example.com",
+    "EMAIL_PASSWORD": "bench",
+    "EMAIL_BACKEND": "sink",
+    "RATE_LIMIT_LOGIN_BURST": "1000000",
+    "RATE_LIMIT_LOGIN_PER_MINUTE": "1000000",
+    "RATE_LIMIT_CHECK_EXISTS_PER_MINUTE": "1000000",
+}
+
+
+class Recorder:
+    """Latencies and failures per endpoint"""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    async def call(
+        self, name: str, client: httpx.AsyncClient, method: str, url: str, **kwargs
+    ) -> httpx.Response | None:
+        start = perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        self.latencies[name].append(perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+            return None
+        return response
+
+
+class _SharedTransport(httpx.AsyncBaseTransport):
+    """Lets per-user clients share one connection pool without closing it"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.transport.handle_async_request(request)
+
+
+def _token(link: str) -> str:
+    return parse_qs(urlparse(link).query)["token"][0]
+
+
+async def virtual_user(
+    recorder: Recorder, make_client, index: int, repeat: int
+) -> None:
+    username = f"bench_{uuid.uuid4().hex[:12]}_{index}"
+    async with make_client() as client:
+        response = await recorder.call(
+            "/auth/register",
+            client,
+            "POST",
+            "/auth/register",
+            json={
+                "email": f"{username}@example.com",
+                "username": username,
+                "first_name": "Bench",
+                "last_name": "User",
+                "password": PASSWORD,
+            },
+        )
+        if response is None:
+            return
+        token = _token(response.json()["detail"])
+
+        if not await recorder.call(
+            "/auth/verify", client, "GET", "/auth/verify", params={"token": token}
+        ):
+            return
+
+        response = await recorder.call(
+            "/auth/login",
+            client,
+            "POST",
+            "/auth/login",
+            data={"username": username, "password": PASSWORD},
+        )
+        if response is None:
+            return
+        token = _token(response.json()["detail"])
+
+        response = await recorder.call(
+            "/auth/confirm-login",
+            client,
+            "GET",
+            "/auth/confirm-login",
+            params={"token": token},
+        )
+        if response is None:
+            return
+        # The cookie is Secure outside DEBUG; set it explicitly for http://
+        client.cookies.set("access_token", response.cookies["access_token"])
+
+        for i in range(repeat):
+            await recorder.call(
+                "/users/get-current", client, "GET", "/users/get-current"
+            )
+            # Alternate hits and misses, as the signup form does
+            await recorder.call(
+                "/users/check-exists",
+                client,
+                "GET",
+                "/users/check-exists",
+                params={"username": username if i % 2 else f"free_{username}"},
+            )
+
+
+@asynccontextmanager
+async def in_process_app():
+    """The real app on SQLite and fakeredis, with its lifespan running"""
+    for key, value in IN_PROCESS_ENV.items():
+        os.environ.setdefault(key, value)
+    sys.path.insert(0, str(SRC_DIR))
+
+    import fakeredis
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlmodel import SQLModel
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    from services import pg_client
+    from services.redis_client import redis_client
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Set before the lifespan runs, so init()/connect() keep these
+        pg_client.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp}/bench.sqlite",
+            poolclass=pg_client.InstrumentedPool,
+        )
+        pg_client.async_session = async_sessionmaker(
+            pg_client.engine, class_=AsyncSession, expire_on_commit=False
+        )
+        redis_client._r = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+        from main import app
+
+        async with pg_client.engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with app.router.lifespan_context(app):
+            yield app
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(p / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict[str, dict]:
+    summary = {}
+    for name in {**recorder.latencies, **recorder.errors}:
+        ordered = sorted(recorder.latencies[name])
+        summary[name] = {
+            "requests": len(ordered),
+            "errors": recorder.errors[name],
+            "p50_ms": percentile(ordered, 50) * 1000,
+            "p95_ms": percentile(ordered, 95) * 1000,
+            "p99_ms": percentile(ordered, 99) * 1000,
+            "rps": len(ordered) / elapsed,
+        }
+    return summary
+
+
+async def run(args) -> tuple[dict[str, dict], float]:
+    recorder = Recorder()
+
+    async def drive(make_client):
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(index: int):
+            async with semaphore:
+                await virtual_user(recorder, make_client, index, args.repeat)
+
+        start = perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.users)))
+        return perf_counter() - start
+
+    # Each virtual user gets its own client (and cookies) over one pool
+    if args.base_url:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncHTTPTransport(limits=limits) as pool:
+            transport = _SharedTransport(pool)
+
+            def make_client():
+                return httpx.AsyncClient(base_url=args.base_url, transport=transport)
+
+            elapsed = await drive(make_client)
+    else:
+        async with in_process_app() as app:
+            transport = _SharedTransport(httpx.ASGITransport(app=app))
+
+            def make_client():
+                return httpx.AsyncClient(base_url="http://bench", transport=transport)
+
+            elapsed = await drive(make_client)
+
+    return summarize(recorder, elapsed), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--base-url", default=None)
+    parser.add_argument("--max-p95-ms", type=float, default=None)
+    parser.add_argument("--json", action="store_true", help="print JSON instead")
+    args = parser.parse_args()
+
+    summary, elapsed = asyncio.run(run(args))
+    total = sum(row["requests"] for row in summary.values())
+
+    if args.json:
+        print(json.dumps({"elapsed_s": elapsed, "endpoints": summary}, indent=2))
+    else:
+        print(
+            f"{'endpoint':<22}{'requests':>9}{'errors':>8}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}"
+        )
+        for name, row in summary.items():
+            print(
+                f"{name:<22}{row['requests']:>9}{row['errors']:>8}"
+                f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+                f"{row['rps']:>9.1f}"
+            )
+        print(
+            f"\n{total} requests in {elapsed:.2f} s ({total / elapsed:.1f} req/s), "
+            f"{args.users} users at concurrency {args.concurrency}"
+        )
+
+    failed = False
+    if any(row["errors"] for row in summary.values()):
+        print("FAIL: some requests errored", file=sys.stderr)
+        failed = True
+    if args.max_p95_ms is not None:
+        for name, row in summary.items():
+            if row["p95_ms"] > args.max_p95_ms:
+                print(
+                    f"FAIL: {name} p95 {row['p95_ms']:.1f} ms exceeds "
+                    f"{args.max_p95_ms:.0f} ms",
+                    file=sys.stderr,
+                )
+                failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+from ipaddress import IPv4Network, IPv6Network, ip_network
 from dotenv import load_dotenv
 from logger import get_app_logger
 
@@ -29,6 +30,65 @@ class _Config:
         except ValueError as e:
             raise ValueError(f"Environment variable {key} must be a valid integer")
 
+    def getenv_or_default(self, key: str, default: str) -> str:
+        value: str | None = os.getenv(key)
+        if not value:
+            return default
+        return value
+
+    def getenv_int_or_default(self, key: str, default: int) -> int:
+        value: str | None = os.getenv(key)
+        if not value:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"Environment variable {key} must be a valid integer")
+
+    def getenv_bool_or_default(self, key: str, default: bool) -> bool:
+        value: str | None = os.getenv(key)
+        if not value:
+            return default
+        return value.lower() in ("true", "1")
+
+    def getenv_float_or_default(self, key: str, default: float) -> float:
+        value: str | None = os.getenv(key)
+        if not value:
+            return default
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"Environment variable {key} must be a valid number")
+
+    def getenv_rates_or_default(
+        self, key: str, default: dict[str, float]
+    ) -> dict[str, float]:
+        value: str | None = os.getenv(key)
+        if not value:
+            return default
+        try:
+            return {
+                name.strip(): float(rate)
+                for name, rate in (pair.split("=") for pair in value.split(","))
+            }
+        except ValueError:
+            raise ValueError(
+                f"Environment variable {key} must look like name=rate,name=rate"
+            )
+
+    def getenv_networks_or_default(
+        self, key: str, default: list[IPv4Network | IPv6Network]
+    ) -> list[IPv4Network | IPv6Network]:
+        value: str | None = os.getenv(key)
+        if not value:
+            return default
+        try:
+            return [ip_network(n.strip(), strict=False) for n in value.split(",")]
+        except ValueError:
+            raise ValueError(
+                f"Environment variable {key} must be comma-separated IPs or CIDRs"
+            )
+
     def _init(self):
         self.logger = get_app_logger()
         load_dotenv()
@@ -42,6 +102,24 @@ class _Config:
             "ALLOW_ORIGINS", redacted=False
         ).split(",")
         self.SECRET_KEY = self.getenv_or_throw("SECRET_KEY", redacted=True)
+        # Reverse proxies (IPs or CIDRs) whose X-Forwarded-For / X-Real-IP are
+        # believed; empty ignores those headers and uses the peer address
+        self.TRUSTED_PROXIES = self.getenv_networks_or_default("TRUSTED_PROXIES", [])
+        # Seconds shutdown may spend draining requests and queued work
+        self.SHUTDOWN_TIMEOUT = self.getenv_int_or_default("SHUTDOWN_TIMEOUT", 20)
+        # Decoded JWTs kept per worker; 0 disables the cache
+        self.JWT_CACHE_SIZE = self.getenv_int_or_default("JWT_CACHE_SIZE", 1024)
+        # Upper bounds for GET /users page sizes and POST /users/batch lookups
+        self.USERS_PAGE_LIMIT = self.getenv_int_or_default("USERS_PAGE_LIMIT", 100)
+        self.USERS_BATCH_LIMIT = self.getenv_int_or_default("USERS_BATCH_LIMIT", 100)
+
+        # Logging
+        # Hands records to a background thread so handler I/O stays off requests
+        self.LOG_QUEUE = self.getenv_bool_or_default("LOG_QUEUE", True)
+        # Fraction of sub-WARNING records kept per logger, e.g. "app.api=0.1"
+        self.LOG_SAMPLE_RATES = self.getenv_rates_or_default("LOG_SAMPLE_RATES", {})
+        # Fraction of requests traced (spans go to the app.trace logger); 0 disables
+        self.TRACE_SAMPLE_RATE = self.getenv_float_or_default("TRACE_SAMPLE_RATE", 0.0)
 
         # PostgreSQL
         self.PG_USER = self.getenv_or_throw("PG_USER", redacted=False)
@@ -49,16 +127,77 @@ class _Config:
         self.PG_HOST = self.getenv_or_throw("PG_HOST", redacted=False)
         self.PG_PORT = self.getenv_int_or_throw("PG_PORT", redacted=False)
         self.PG_NAME = self.getenv_or_throw("PG_NAME", redacted=False)
+        self.PG_POOL_SIZE = self.getenv_int_or_default("PG_POOL_SIZE", 5)
+        self.PG_MAX_OVERFLOW = self.getenv_int_or_default("PG_MAX_OVERFLOW", 10)
+        self.PG_POOL_TIMEOUT = self.getenv_int_or_default("PG_POOL_TIMEOUT", 30)
+        self.PG_POOL_RECYCLE = self.getenv_int_or_default("PG_POOL_RECYCLE", 1800)
+        self.PG_POOL_PRE_PING = self.getenv_bool_or_default("PG_POOL_PRE_PING", True)
+        # 0 disables the server-side statement timeout
+        self.PG_STATEMENT_TIMEOUT_MS = self.getenv_int_or_default(
+            "PG_STATEMENT_TIMEOUT_MS", 0
+        )
+
+        # Password hashing
+        self.HASH_WORKERS = self.getenv_int_or_default(
+            "HASH_WORKERS", os.cpu_count() or 1
+        )
+        self.HASH_QUEUE_LIMIT = self.getenv_int_or_default("HASH_QUEUE_LIMIT", 32)
 
         # Redis
         self.REDIS_HOST = self.getenv_or_throw("REDIS_HOST", redacted=False)
         self.REDIS_PORT = self.getenv_int_or_throw("REDIS_PORT", redacted=False)
         self.REDIS_PASSWORD = self.getenv_or_throw("REDIS_PASSWORD", redacted=True)
         self.REDIS_DB = self.getenv_or_throw("REDIS_DB", redacted=False)
+        # Identical non-GET requests within this window replay the first response
+        self.IDEMPOTENCY_DEDUP_TTL_MS = self.getenv_int_or_default(
+            "IDEMPOTENCY_DEDUP_TTL_MS", 250
+        )
+        # How long responses to requests carrying an Idempotency-Key are kept
+        self.IDEMPOTENCY_KEY_TTL = self.getenv_int_or_default(
+            "IDEMPOTENCY_KEY_TTL", 86400
+        )
+        # "redis" shares limits across workers, "memory" keeps them per worker
+        self.RATE_LIMIT_BACKEND = self.getenv_or_default(
+            "RATE_LIMIT_BACKEND", "redis"
+        ).lower()
+        self.RATE_LIMIT_LOGIN_BURST = self.getenv_int_or_default(
+            "RATE_LIMIT_LOGIN_BURST", 5
+        )
+        self.RATE_LIMIT_LOGIN_PER_MINUTE = self.getenv_int_or_default(
+            "RATE_LIMIT_LOGIN_PER_MINUTE", 10
+        )
+        self.RATE_LIMIT_CHECK_EXISTS_PER_MINUTE = self.getenv_int_or_default(
+            "RATE_LIMIT_CHECK_EXISTS_PER_MINUTE", 30
+        )
+        self.USER_CACHE_TTL = self.getenv_int_or_default("USER_CACHE_TTL", 300)
+        self.USER_CACHE_NEGATIVE_TTL = self.getenv_int_or_default(
+            "USER_CACHE_NEGATIVE_TTL", 30
+        )
+        # Bloom filter answering "no such user" for availability checks
+        self.USER_BLOOM_ENABLED = self.getenv_bool_or_default("USER_BLOOM_ENABLED", True)
+        # Users it is sized for; past this the false-positive rate climbs
+        self.USER_BLOOM_CAPACITY = self.getenv_int_or_default(
+            "USER_BLOOM_CAPACITY", 1_000_000
+        )
+        self.USER_BLOOM_ERROR_RATE = self.getenv_float_or_default(
+            "USER_BLOOM_ERROR_RATE", 0.001
+        )
+        # Seconds between full rebuilds (clearing deleted users); 0 never rebuilds
+        self.USER_BLOOM_REBUILD_INTERVAL = self.getenv_int_or_default(
+            "USER_BLOOM_REBUILD_INTERVAL", 86400
+        )
 
         # SMTP
         self.EMAIL_ADDRESS = self.getenv_or_throw("EMAIL_ADDRESS", redacted=False)
         self.EMAIL_PASSWORD = self.getenv_or_throw("EMAIL_PASSWORD", redacted=True)
+        self.SMTP_HOST = self.getenv_or_default("SMTP_HOST", "smtp.gmail.com")
+        self.SMTP_PORT = self.getenv_int_or_default("SMTP_PORT", 465)
+        # "smtp" delivers for real, "sink" keeps messages in memory (tests/dev)
+        self.EMAIL_BACKEND = self.getenv_or_default("EMAIL_BACKEND", "smtp").lower()
+        self.EMAIL_WORKERS = self.getenv_int_or_default("EMAIL_WORKERS", 2)
+        self.EMAIL_QUEUE_SIZE = self.getenv_int_or_default("EMAIL_QUEUE_SIZE", 1000)
+        self.EMAIL_BATCH_SIZE = self.getenv_int_or_default("EMAIL_BATCH_SIZE", 20)
+        self.EMAIL_MAX_RETRIES = self.getenv_int_or_default("EMAIL_MAX_RETRIES", 5)
 
 
 config = _Config()
@@ -1,5 +1,5 @@
-from fastapi import Cookie, Depends, HTTPException, Response
-from sqlmodel import Session
+from fastapi import Cookie, Depends, HTTPException, Request, Response
+from sqlmodel.ext.asyncio.session import AsyncSession
 from services.pg_client import depends_get_db, get_user
 from logger import get_api_logger
 from lib.http_exception import (
@@ -9,52 +9,123 @@ from lib.http_exception import (
     UserNotFoundException,
 )
 from lib.jwt import TokenPayload, parse_jwt
-from lib.crypto import verify_password
+from lib.crypto import verify_password_async
+from services import user_bloom
+from services.tracing import span
 from models import User
 from config import _Config
 
 config = _Config()
 
 
-def require_authenticated(
-    db: Session = Depends(depends_get_db),
+class Identity:
+    """
+    Request-scoped memo of decoded tokens and looked-up users, so the auth
+    dependencies and the route body verify each token and look up each user
+    at most once per request. Obtained with Depends(get_identity).
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self._payloads: dict[str, TokenPayload | HTTPException] = {}
+        # Keyed by lowercased username and email, as lookups are
+        self._users: dict[str, User | None] = {}
+
+    def payload(self, token: str | None) -> TokenPayload:
+        if not token:
+            return parse_jwt(token)
+        if token not in self._payloads:
+            try:
+                self._payloads[token] = parse_jwt(token)
+            except HTTPException as e:
+                self._payloads[token] = e
+        payload = self._payloads[token]
+        if isinstance(payload, HTTPException):
+            raise payload
+        return payload
+
+    async def user(self, identifier: str, with_password: bool = False) -> User | None:
+        key = identifier.lower()
+        memo = self._users.get(key)
+        # Users served from the cache have no hashed_password; look those up
+        # again, bypassing the cache, when it's needed
+        if key not in self._users or (
+            with_password and memo is not None and memo.hashed_password is None
+        ):
+            user = await get_user(self.db, identifier, use_cache=not with_password)
+            self._users[key] = user
+            if user:
+                self._users[user.username.lower()] = user
+                self._users[user.email.lower()] = user
+        return self._users[key]
+
+    async def user_from_token(self, token: str | None) -> User:
+        username = self.payload(token).get("sub")
+        if username is None:
+            raise UserNotFoundException
+        user: User | None = await self.user(username)
+        if not user:
+            raise UserNotFoundException
+        return user
+
+
+async def get_identity(
+    request: Request, db: AsyncSession = Depends(depends_get_db)
+) -> Identity:
+    identity = getattr(request.state, "identity", None)
+    if identity is None:
+        identity = request.state.identity = Identity(db)
+    return identity
+
+
+async def require_authenticated(
+    identity: Identity = Depends(get_identity),
     access_token: str | None = Cookie(default=None, include_in_schema=False),
 ) -> User:
     try:
-        user: User = get_user_from_token(db, access_token)
+        user: User = await identity.user_from_token(access_token)
         return user
     except UserNotFoundException as e:
         if access_token:
-            get_api_logger().info(f"Deleting access token {access_token[:3]}***")
+            get_api_logger().info("Deleting access token %s***", access_token[:3])
             e.clear_cookie = True
         raise e
 
 
-def require_unauthenticated(
-    db: Session = Depends(depends_get_db),
+async def require_unauthenticated(
+    identity: Identity = Depends(get_identity),
     access_token: str | None = Cookie(default=None, include_in_schema=False),
 ) -> None:
     try:
-        get_user_from_token(db, access_token)
+        await identity.user_from_token(access_token)
         raise HTTPException(status_code=403, detail="Already authenticated.")
     except Exception:
         return None
 
 
-def user_exists(db: Session, identifier: str):
-    user = get_user(db, identifier)
+async def user_exists(db: AsyncSession, identifier: str):
+    if await user_bloom.might_contain(identifier) is False:
+        return False
+    user = await get_user(db, identifier)
     return bool(user)
 
 
-def is_user_verified(db: Session, identifier: str):
-    user = get_user(db, identifier)
+async def is_user_verified(db: AsyncSession, identifier: str):
+    if await user_bloom.might_contain(identifier) is False:
+        raise UserNotFoundException
+    user = await get_user(db, identifier)
     if not user:
         raise UserNotFoundException
     return bool(user.verified)
 
 
-def validate_credentials(db: Session, identifier: str, password: str) -> User:
-    user: User | None = get_user(db, identifier)
+async def validate_credentials(identity: Identity, identifier: str, password: str) -> User:
+    with span("validate_credentials"):
+        return await _validate_credentials(identity, identifier, password)
+
+
+async def _validate_credentials(identity: Identity, identifier: str, password: str) -> User:
+    user: User | None = await identity.user(identifier, with_password=True)
 
     # Check user exists
     if not user:
@@ -64,7 +135,7 @@ def validate_credentials(db: Session, identifier: str, password: str) -> User:
             raise AuthenticationException
 
     # Check password matches
-    password_ok = verify_password(password, user.hashed_password)
+    password_ok = await verify_password_async(password, user.hashed_password)
 
     if not password_ok:
         if config.DEBUG:
@@ -78,13 +149,3 @@ def validate_credentials(db: Session, identifier: str, password: str) -> User:
 
     return user
 
-
-def get_user_from_token(db: Session, access_token: str | None):
-    jwt_data: TokenPayload = parse_jwt(access_token)
-    username = jwt_data.get("sub")
-    if username is None:
-        raise UserNotFoundException
-    user: User | None = get_user(db, username)
-    if not user:
-        raise UserNotFoundException
-    return user
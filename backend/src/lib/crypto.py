@@ -1,7 +1,20 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
 from passlib.context import CryptContext
 
+from config import config
+from lib.http_exception import ServiceUnavailableException
+from services.metrics import bcrypt_duration
+from services.tracing import span
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt releases the GIL while hashing, so a thread pool spreads the work
+# across cores without blocking the event loop. Created on first use.
+_executor: ThreadPoolExecutor | None = None
+_pending = 0
+
 
 def hash_password(password) -> str:
     return pwd_context.hash(password)
@@ -9,3 +22,46 @@ def hash_password(password) -> str:
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
+
+
+async def _run_in_executor(fn, *args):
+    """Run fn on the hashing pool, rejecting work once the queue is full"""
+    global _executor, _pending
+    if _pending >= config.HASH_WORKERS + config.HASH_QUEUE_LIMIT:
+        raise ServiceUnavailableException
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=config.HASH_WORKERS, thread_name_prefix="bcrypt"
+        )
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _pending -= 1
+
+
+def _timed(operation: str, fn, *args):
+    start = perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        bcrypt_duration.labels(operation).observe(perf_counter() - start)
+
+
+async def hash_password_async(password) -> str:
+    with span("bcrypt.hash"):
+        return await _run_in_executor(_timed, "hash", hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    with span("bcrypt.verify"):
+        return await _run_in_executor(
+            _timed, "verify", verify_password, plain_password, hashed_password
+        )
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
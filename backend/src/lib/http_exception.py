@@ -24,6 +24,13 @@ class UnverifiedException(HTTPException):
         )
 
 
+class ServiceUnavailableException(HTTPException):
+    def __init__(self) -> None:
+        super().__init__(
+            status_code=503, detail="Server is busy. Please try again later."
+        )
+
+
 class UserNotFoundException(HTTPException):
     def __init__(self, detail: str = "User not found", clear_cookie: bool = False):
         super().__init__(status_code=401, detail=detail)
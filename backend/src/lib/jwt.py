@@ -1,4 +1,7 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from hashlib import sha256
+import time
 from typing import Any, TypedDict, cast
 from fastapi import HTTPException, Response
 import jwt
@@ -24,6 +27,46 @@ class TokenPayload(TypedDict):
     exp: datetime
 
 
+class _TokenCache:
+    """
+    Per-worker LRU of decoded tokens, keyed by a digest of the token.
+    Entries are dropped once the token's exp has passed.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[bytes, tuple[int, TokenPayload]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> TokenPayload | None:
+        key = sha256(token.encode()).digest()
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, payload = entry
+        if expires_at <= time.time():
+            del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return cast(TokenPayload, dict(payload))
+
+    def put(self, token: str, expires_at: int, payload: TokenPayload):
+        if self.maxsize <= 0:
+            return
+        self.entries[sha256(token.encode()).digest()] = (expires_at, payload)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+token_cache = _TokenCache(config.JWT_CACHE_SIZE)
+
+
 def _encode_jwt(payload: TokenPayloadRaw) -> str:
     encoded_jwt = jwt.encode(
         payload=cast(dict[str, Any], payload),
@@ -77,6 +120,11 @@ def _decode_jwt(token: str | None) -> TokenPayloadRaw:
 
 
 def parse_jwt(token: str | None) -> TokenPayload:
+    if token:
+        cached = token_cache.get(token)
+        if cached is not None:
+            return cached
+
     payload_raw: TokenPayloadRaw = _decode_jwt(token)
 
     subject: str = payload_raw.get("sub")
@@ -89,7 +137,9 @@ def parse_jwt(token: str | None) -> TokenPayload:
 
     payload: TokenPayload = {"sub": subject, "iat": issued_at, "exp": expires}
 
-    return payload
+    token_cache.put(cast(str, token), expires_str, payload)
+
+    return cast(TokenPayload, dict(payload))
 
 
 def set_access_token_cookie(response: Response, access_token: str):
@@ -1,5 +1,7 @@
 from datetime import datetime, timezone
+from ipaddress import ip_address
 from fastapi import Request
+from config import config
 
 
 def now():
@@ -21,18 +23,36 @@ def mask_email(email: str) -> str:
     return f"{masked_local}@{domain}"
 
 
+def _is_trusted_proxy(ip: str) -> bool:
+    try:
+        address = ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in network for network in config.TRUSTED_PROXIES)
+
+
 def get_client_ip(request: Request) -> str | None:
-    # Check common proxy headers first
+    """
+    The direct peer's address. Forwarding headers are only believed when the
+    peer is one of TRUSTED_PROXIES, since any client can send them; then the
+    right-most X-Forwarded-For hop that isn't a trusted proxy is the client.
+    """
+    ip = request.client.host if request.client else None
+    if ip is None or not _is_trusted_proxy(ip):
+        return ip
+
     forwarded_for = request.headers.get("X-Forwarded-For")
     if forwarded_for:
-        # Take the first IP in case of multiple proxies
-        return forwarded_for.split(",")[0].strip()
+        hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+        for hop in reversed(hops):
+            if not _is_trusted_proxy(hop):
+                return hop
+        # Every hop is a proxy of ours; the first is closest to the client
+        if hops:
+            return hops[0]
 
     real_ip = request.headers.get("X-Real-IP")
     if real_ip:
-        return real_ip
-
-    # Fallback to direct connection
-    ip = request.client.host if request.client else None
+        return real_ip.strip()
 
     return ip
@@ -1,4 +1,20 @@
+import json
 import logging
+import random
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+# Loggers whose handlers move behind a queue; see start_queue_logging
+_QUEUED_LOGGERS = (
+    "app",
+    "app.api",
+    "app.postgres",
+    "app.redis",
+    "app.email",
+    "app.trace",
+)
+
+_listeners: list[QueueListener] = []
 
 
 def get_app_logger():
@@ -15,3 +31,91 @@ def get_postgres_logger():
 
 def get_redis_logger():
     return logging.getLogger("app.redis")
+
+
+def get_email_logger():
+    return logging.getLogger("app.email")
+
+
+def get_trace_logger():
+    return logging.getLogger("app.trace")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "func": record.funcName,
+            "line": record.lineno,
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of records below WARNING; warnings and errors always pass"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class _QueueHandler(QueueHandler):
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Records never leave the process, so merging args and rendering
+        # tracebacks is left to the listener thread instead of the caller
+        return record
+
+
+def set_sample_rates(sample_rates: dict[str, float]):
+    """Samples each named logger's own records; rates of 1 or more keep everything"""
+    for name, rate in sample_rates.items():
+        logger = logging.getLogger(name)
+        for existing in [f for f in logger.filters if isinstance(f, SamplingFilter)]:
+            logger.removeFilter(existing)
+        if rate < 1:
+            logger.addFilter(SamplingFilter(rate))
+
+
+def start_queue_logging():
+    """Moves the configured handlers of the app loggers onto a background thread"""
+    if _listeners:
+        return
+    for name in _QUEUED_LOGGERS:
+        logger = logging.getLogger(name)
+        handlers = [h for h in logger.handlers if not isinstance(h, QueueHandler)]
+        if not handlers:
+            continue
+        queue = SimpleQueue()
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(_QueueHandler(queue))
+        listener = QueueListener(queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+
+
+def stop_queue_logging():
+    """Flushes queued records and puts the handlers back on their loggers"""
+    while _listeners:
+        listener = _listeners.pop()
+        listener.stop()
+        for name in _QUEUED_LOGGERS:
+            logger = logging.getLogger(name)
+            for handler in list(logger.handlers):
+                if isinstance(handler, _QueueHandler) and handler.queue is listener.queue:
+                    logger.removeHandler(handler)
+                    for h in listener.handlers:
+                        logger.addHandler(h)
@@ -1,65 +1,140 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 import uvicorn
-from middleware.custom_interceptor import custom_interceptor
-from middleware.exception_handlers import http_exception_handler, user_not_found_handler
+from config import config
+from middleware.custom_interceptor import CustomInterceptor
+from middleware.in_flight import InFlightMiddleware, in_flight_requests
+from middleware.metrics import MetricsMiddleware
+from middleware.tracing import TracingMiddleware
+from middleware.exception_handlers import (
+    http_exception_handler,
+    user_not_found_handler,
+    validation_exception_handler,
+)
+from lib import crypto
 from lib.http_exception import UserNotFoundException
-from models.response import BaseResponse
-from logger import get_app_logger
+from models.response import BaseResponse, ModelJSONResponse
+from logger import (
+    get_app_logger,
+    set_sample_rates,
+    start_queue_logging,
+    stop_queue_logging,
+)
+from routes.auth import auth_router
+from routes.users import users_router
+from services import metrics, pg_client, user_bloom
+from services.email_client import email_client
+from services.redis_client import redis_client
 
 logging.getLogger("passlib").setLevel(logging.ERROR)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    """Clients are created here, once per worker, rather than at import time"""
+    set_sample_rates(config.LOG_SAMPLE_RATES)
+    if config.LOG_QUEUE:
+        start_queue_logging()
     logger = get_app_logger()
     logger.info("Starting app...")
 
-    import config
-    from services import pg_client, redis_client
+    pg_client.init()
+    redis_client.connect()
 
-    db = pg_client.get_db()
-    pg_con = pg_client.test_connection(db)
+    async with pg_client.async_session() as db:  # type: ignore[misc]
+        pg_con = await pg_client.test_connection(db)
     if not pg_con:
         raise HTTPException(503, "PostgreSQL connection failed.")
 
-    redis_con = await redis_client.redis_client.test_connection()
+    redis_con = await redis_client.test_connection()
     if not redis_con:
         raise HTTPException(503, "Redis connection failed.")
 
-    from routes.auth import auth_router
-    from routes.users import users_router
-
-    app.include_router(auth_router, prefix="/auth")
-    app.include_router(users_router, prefix="/users")
+    await email_client.start()
 
+    # In the background; availability checks use the DB until it's ready
+    # (and, after each expiry, until it's rebuilt)
+    user_bloom_rebuild = asyncio.create_task(_rebuild_user_bloom())
 
     yield
 
+    user_bloom_rebuild.cancel()
+    await asyncio.gather(user_bloom_rebuild, return_exceptions=True)
+    await _shutdown()
+
+
+async def _rebuild_user_bloom():
+    """Builds the user filter if needed, then rebuilds it each time it expires"""
+    while True:
+        try:
+            async with pg_client.async_session() as db:  # type: ignore[misc]
+                await user_bloom.rebuild(db)
+        except Exception as e:
+            get_app_logger().error("User filter rebuild failed: %s", e)
+        if config.USER_BLOOM_REBUILD_INTERVAL <= 0:
+            return
+        await asyncio.sleep(user_bloom.REBUILD_CHECK_SECONDS)
+
+
+async def _shutdown():
+    """
+    Wait for in-flight requests and queued emails (sharing SHUTDOWN_TIMEOUT),
+    then release the pools so connections aren't left open server-side
+    """
+    logger = get_app_logger()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + config.SHUTDOWN_TIMEOUT
+
+    logger.info("Shutting down, %d requests in flight...", in_flight_requests.count)
+    try:
+        await asyncio.wait_for(in_flight_requests.idle.wait(), config.SHUTDOWN_TIMEOUT)
+    except TimeoutError:
+        logger.error("Shutting down with %d requests in flight", in_flight_requests.count)
+
+    await email_client.stop(timeout=max(deadline - loop.time(), 0))
+    crypto.shutdown()
+
+    for name, close in (("PostgreSQL", pg_client.dispose), ("Redis", redis_client.close)):
+        try:
+            await close()
+        except Exception as e:
+            logger.error("Closing %s failed: %s", name, e)
 
-app = FastAPI(lifespan=lifespan)
+    logger.info("Shutdown complete")
+    stop_queue_logging()
 
-import os
-from dotenv import load_dotenv
 
-load_dotenv()
+app = FastAPI(lifespan=lifespan, default_response_class=ModelJSONResponse)
 
-ALLOW_ORIGINS = os.getenv("ALLOW_ORIGINS")
-if not ALLOW_ORIGINS:
-    ALLOW_ORIGINS = ""
+app.include_router(auth_router, prefix="/auth")
+app.include_router(users_router, prefix="/users")
 
-ALLOW_ORIGINS = ALLOW_ORIGINS.split(",")
+# Added before CORS so replayed responses still get CORS headers
+app.add_middleware(CustomInterceptor)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=ALLOW_ORIGINS,
+    allow_origins=config.ALLOW_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+# Times everything below it, including CORS and the interceptor
+app.add_middleware(MetricsMiddleware)
+
+# Request IDs are set before the inner middleware log anything
+app.add_middleware(TracingMiddleware)
+
+# Outermost, so every request is counted until its response is sent
+app.add_middleware(InFlightMiddleware)
+
 app_logger = get_app_logger()
 
 
@@ -68,16 +143,14 @@ async def _user_not_found_handler(request: Request, exc: UserNotFoundException):
     return await user_not_found_handler(request, exc)
 
 
-@app.exception_handler(HTTPException)
-async def _http_exception_handler(request: Request, exc: HTTPException):
+@app.exception_handler(StarletteHTTPException)
+async def _http_exception_handler(request: Request, exc: StarletteHTTPException):
     return await http_exception_handler(request, exc)
 
 
-@app.middleware("http")
-async def _custom_interceptor(request: Request, call_next):
-    if request.url.path in ["/", "/docs", "/openapi.json"]:
-        return await call_next(request)
-    return await custom_interceptor(request, call_next)
+@app.exception_handler(RequestValidationError)
+async def _validation_exception_handler(request: Request, exc: RequestValidationError):
+    return await validation_exception_handler(request, exc)
 
 
 @app.get("/")
@@ -86,5 +159,16 @@ async def root():
     return BaseResponse.ok("DevTeamer API")
 
 
+@app.get("/health")
+async def health():
+    return BaseResponse.ok("Healthy", data={"postgres": pg_client.get_pool_stats()})
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, log_config="log_conf.yaml")
@@ -1,84 +1,188 @@
-from json import JSONDecodeError
-import json
-
-from fastapi import Request
-
-from logger import get_app_logger
-from lib.utils import get_client_ip
-from models.response import BaseResponse
-
-
-async def custom_interceptor(request: Request, call_next):
-    # Check for duplicate request first
-    duplicate_response = await check_duplicate_request(request)
-    if duplicate_response:
-        return duplicate_response.to_json_response()
-
-    response = await call_next(request)
-    original_headers = dict(response.headers)
-
-    body = b""
-    async for chunk in response.body_iterator:
-        body += chunk
-
-    try:
-        response_data = json.loads(body.decode())
-        get_app_logger().info(response_data)
-
-        # Check if FastAPI error response
-        if "detail" in response_data and len(response_data) == 1:
-            base_response = BaseResponse.error(
-                detail=response_data["detail"], status=response.status_code
+import asyncio
+from typing import Iterable
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+EXCLUDED_PATHS = frozenset(
+    {
+        "/",
+        "/docs",
+        "/docs/oauth2-redirect",
+        "/redoc",
+        "/openapi.json",
+        "/health",
+        "/metrics",
+    }
+)
+
+# Reads never change state, so they are always executed
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# Larger responses are passed through without being recorded
+MAX_RECORDED_BODY = 1024 * 1024
+
+
+class CustomInterceptor:
+    """
+    Raw ASGI middleware deduplicating state-changing requests.
+
+    Requests are fingerprinted by caller, method, path and body (or the
+    Idempotency-Key header). A repeat within the TTL replays the recorded
+    response, and identical requests arriving while the first is still
+    executing in this worker wait for it instead of running again. A key
+    reused with a different body is rejected with 422 rather than replayed.
+    """
+
+    def __init__(self, app: ASGIApp, excluded_paths: Iterable[str] = EXCLUDED_PATHS):
+        self.app = app
+        self.excluded_paths = frozenset(excluded_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] in SAFE_METHODS
+            or scope["path"] in self.excluded_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        from config import config
+        from services import idempotency
+
+        body = await _read_body(receive)
+        receive = _replay_receive(body, receive)
+
+        idempotency_key = Headers(scope=scope).get("idempotency-key")
+        fingerprint = idempotency.fingerprint(scope, body, idempotency_key)
+        request_hash = idempotency.request_hash(body) if idempotency_key else None
+
+        waiter = idempotency.in_flight.get(fingerprint)
+        if waiter is not None:
+            recorded = await asyncio.shield(waiter)
+            if recorded is not None:
+                await _replay(recorded, request_hash, scope, receive, send)
+            else:
+                # The first execution couldn't be shared (e.g. it failed)
+                await self.app(scope, receive, send)
+            return
+
+        # Registered before the Redis lookup so concurrent duplicates find it
+        future = asyncio.get_running_loop().create_future()
+        idempotency.in_flight[fingerprint] = future
+        recorder = _ResponseRecorder(send)
+        recorded = None
+        try:
+            recorded = await idempotency.get_response(fingerprint)
+            if recorded is not None:
+                await _replay(recorded, request_hash, scope, receive, send)
+                return
+            await self.app(scope, receive, recorder.send)
+            recorded = recorder.result(request_hash)
+        finally:
+            del idempotency.in_flight[fingerprint]
+            future.set_result(recorded)
+
+        # Server errors aren't replayed so a retry gets a fresh attempt
+        if recorded is not None and recorded.status < 500:
+            ttl_ms = (
+                config.IDEMPOTENCY_KEY_TTL * 1000
+                if idempotency_key
+                else config.IDEMPOTENCY_DEDUP_TTL_MS
             )
-        else:
-            # Custom response
-            if "detail" not in response_data:
-                response_data["detail"] = "Something went wrong"
-            if "status" not in response_data:
-                response_data["status"] = response.status_code
-            if "meta" not in response_data:
-                response_data["meta"] = {}
-
-            base_response = BaseResponse(**response_data)
-
-        await store_request(request, base_response)
-
-        new_response = base_response.to_json_response()
-        for key, value in original_headers.items():
-            if key.lower() not in ["content-length", "content-type"]:
-                new_response.headers[key] = value
-
-        return new_response
-
-    except (JSONDecodeError, UnicodeDecodeError):
-        wrapped = BaseResponse.error(detail="Invalid response format")
-        await store_request(request, wrapped)
-        return wrapped.to_json_response()
-
-
-async def check_duplicate_request(request: Request):
-    from services.redis_client import redis_client
-
-    ip = get_client_ip(request)
-    last_request_key = f"{ip}_LAST_REQUEST"
-
-    last_request = await redis_client.r.get(last_request_key)
-    if last_request:
-        # Return cached response for duplicate
-        response = BaseResponse(**json.loads(last_request))
-        response.meta["cached"] = "true"
-        return response
-
-    return None
-
-
-async def store_request(request: Request, base_response: BaseResponse):
-    from services.redis_client import redis_client
-
-    ip = get_client_ip(request)
-    last_request_key = f"{ip}_LAST_REQUEST"
-    last_request_expiry_px = 250
-
-    await redis_client.r.set(
-        last_request_key, base_response.model_dump_json(), px=last_request_expiry_px
-    )
+            await idempotency.store_response(fingerprint, recorded, ttl_ms)
+
+
+class _ResponseRecorder:
+    """Forwards response messages while keeping a copy of the response"""
+
+    def __init__(self, send: Send):
+        self._send = send
+        self.status: int | None = None
+        self.headers: list[tuple[str, str]] = []
+        self.chunks: list[bytes] | None = []
+        self.size = 0
+        self.complete = False
+
+    async def send(self, message: Message):
+        await self._send(message)
+
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            self.headers = [
+                (k.decode("latin-1"), v.decode("latin-1"))
+                for k, v in message.get("headers", [])
+            ]
+        elif message["type"] == "http.response.body" and self.chunks is not None:
+            chunk = message.get("body", b"")
+            self.size += len(chunk)
+            if self.size > MAX_RECORDED_BODY:
+                self.chunks = None
+                return
+            self.chunks.append(chunk)
+            self.complete = not message.get("more_body", False)
+
+    def result(self, request_hash: str | None):
+        from services.idempotency import RecordedResponse
+
+        if self.status is None or self.chunks is None or not self.complete:
+            return None
+        try:
+            body = b"".join(self.chunks).decode()
+        except UnicodeDecodeError:
+            return None
+        return RecordedResponse(
+            status=self.status,
+            headers=self.headers,
+            body=body,
+            request_hash=request_hash,
+        )
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks: list[bytes] = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+def _replay_receive(body: bytes, receive: Receive) -> Receive:
+    sent = False
+
+    async def replay_receive() -> Message:
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay_receive
+
+
+async def _replay(
+    recorded, request_hash: str | None, scope: Scope, receive: Receive, send: Send
+):
+    if recorded.request_hash != request_hash:
+        from models.response import BaseResponse
+
+        response = BaseResponse.error(
+            "Idempotency-Key was already used with a different request body.", 422
+        ).to_json_response()
+        await response(scope, receive, send)
+        return
+
+    headers = [
+        (k.encode("latin-1"), v.encode("latin-1"))
+        for k, v in recorded.headers
+        if k.lower() != "content-length"
+    ]
+    body = recorded.body.encode()
+    headers.append((b"content-length", str(len(body)).encode()))
+    headers.append((b"idempotent-replayed", b"true"))
+    await send({"type": "http.response.start", "status": recorded.status, "headers": headers})
+    await send({"type": "http.response.body", "body": body, "more_body": False})
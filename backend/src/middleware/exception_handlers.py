@@ -1,11 +1,25 @@
-from fastapi import HTTPException, Request
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from starlette.exceptions import HTTPException
 from models.response import BaseResponse
 from lib.jwt import delete_access_token_cookie
 from lib.http_exception import UserNotFoundException
 
 
 async def http_exception_handler(request: Request, exc: HTTPException):
-    return BaseResponse.error(exc.detail, exc.status_code).to_json_response()
+    response = BaseResponse.error(exc.detail, exc.status_code).to_json_response()
+    if exc.headers:
+        response.headers.update(exc.headers)
+    return response
+
+
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    errors = jsonable_encoder(exc.errors())
+    detail = errors[0]["msg"] if errors else "Invalid request."
+    return BaseResponse.error(
+        detail, 422, meta={"errors": errors}
+    ).to_json_response()
 
 
 async def user_not_found_handler(request: Request, exc: UserNotFoundException):
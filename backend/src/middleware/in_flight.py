@@ -0,0 +1,44 @@
+import asyncio
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class _InFlightRequests:
+
+    def __init__(self):
+        self.count = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def started(self):
+        self.count += 1
+        self.idle.clear()
+
+    def finished(self):
+        self.count -= 1
+        if self.count == 0:
+            self.idle.set()
+
+
+in_flight_requests = _InFlightRequests()
+
+
+class InFlightMiddleware:
+    """
+    Raw ASGI middleware counting the HTTP requests being handled, so that
+    shutdown can wait for them before tearing down the clients.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        in_flight_requests.started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            in_flight_requests.finished()
@@ -0,0 +1,39 @@
+from time import perf_counter
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from services.metrics import http_request_duration, http_requests
+
+
+class MetricsMiddleware:
+    """
+    Raw ASGI middleware recording request counts and latency per route.
+    Routes are labelled by their template (e.g. /users/{username}) to keep
+    label cardinality bounded; unmatched paths share one label.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = perf_counter() - start
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            http_request_duration.labels(method, route).observe(elapsed)
+            http_requests.labels(method, route, str(status)).inc()
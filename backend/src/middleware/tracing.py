@@ -0,0 +1,51 @@
+from uuid import uuid4
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from services import tracing
+
+REQUEST_ID_HEADER = "x-request-id"
+# Longer client-supplied IDs are replaced rather than echoed back
+MAX_REQUEST_ID_LENGTH = 128
+
+
+class TracingMiddleware:
+    """
+    Raw ASGI middleware giving every request an ID (the client's
+    X-Request-ID, or a new one), echoed in the response and attached to log
+    records, and recording a root span for sampled requests.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get(REQUEST_ID_HEADER)
+        if not request_id or len(request_id) > MAX_REQUEST_ID_LENGTH:
+            request_id = uuid4().hex
+        request_id_token = tracing.request_id.set(request_id)
+        trace_token = tracing.start_trace(request_id)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                attributes["status"] = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (REQUEST_ID_HEADER.encode(), request_id.encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            with tracing.span(
+                "http.request", method=scope["method"], path=scope["path"]
+            ) as attributes:
+                await self.app(scope, receive, send_wrapper)
+                attributes["route"] = getattr(scope.get("route"), "path", None)
+        finally:
+            tracing.finish_trace(trace_token)
+            tracing.request_id.reset(request_id_token)
@@ -0,0 +1,85 @@
+"""
+Database migrations CLI. Run once per deploy, before starting the workers,
+so that app startup performs no DDL.
+
+    python migrate.py upgrade [revision]      (default: head)
+    python migrate.py downgrade <revision>
+    python migrate.py current
+    python migrate.py history
+    python migrate.py revision -m "message" [--autogenerate]
+    python migrate.py rebuild-user-filter
+
+rebuild-user-filter rebuilds the Bloom filter behind the availability
+checks now, e.g. after changing its size or deleting many users.
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+
+
+def get_alembic_config() -> Config:
+    alembic_config = Config()
+    alembic_config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    return alembic_config
+
+
+async def rebuild_user_filter():
+    from services import pg_client, user_bloom
+    from services.redis_client import redis_client
+
+    pg_client.init()
+    redis_client.connect()
+    try:
+        async with pg_client.async_session() as db:  # type: ignore[misc]
+            await user_bloom.rebuild(db, force=True)
+    finally:
+        await pg_client.dispose()
+        await redis_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DevTeamer database migrations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    upgrade = subparsers.add_parser("upgrade")
+    upgrade.add_argument("revision", nargs="?", default="head")
+
+    downgrade = subparsers.add_parser("downgrade")
+    downgrade.add_argument("revision")
+
+    subparsers.add_parser("current")
+    subparsers.add_parser("history")
+
+    revision = subparsers.add_parser("revision")
+    revision.add_argument("-m", "--message", required=True)
+    revision.add_argument("--autogenerate", action="store_true")
+
+    subparsers.add_parser("rebuild-user-filter")
+
+    args = parser.parse_args()
+    alembic_config = get_alembic_config()
+
+    if args.command == "upgrade":
+        command.upgrade(alembic_config, args.revision)
+    elif args.command == "downgrade":
+        command.downgrade(alembic_config, args.revision)
+    elif args.command == "current":
+        command.current(alembic_config, verbose=True)
+    elif args.command == "history":
+        command.history(alembic_config)
+    elif args.command == "revision":
+        command.revision(
+            alembic_config, message=args.message, autogenerate=args.autogenerate
+        )
+    elif args.command == "rebuild-user-filter":
+        asyncio.run(rebuild_user_filter())
+
+
+if __name__ == "__main__":
+    main()
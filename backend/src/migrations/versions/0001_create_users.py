@@ -0,0 +1,53 @@
+"""create users
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+Databases bootstrapped by the old SQLModel.metadata.create_all already have
+the users table, so everything here is created only if missing.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("email", sqlmodel.AutoString(), nullable=False),
+        sa.Column("username", sqlmodel.AutoString(length=50), nullable=False),
+        sa.Column("first_name", sqlmodel.AutoString(length=50), nullable=True),
+        sa.Column("last_name", sqlmodel.AutoString(length=50), nullable=True),
+        sa.Column("hashed_password", sqlmodel.AutoString(), nullable=False),
+        sa.Column("verified", sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index(
+        "uq_users_username_lower",
+        "users",
+        [sa.text("lower(username)")],
+        unique=True,
+        if_not_exists=True,
+    )
+    op.create_index(
+        "uq_users_email_lower",
+        "users",
+        [sa.text("lower(email)")],
+        unique=True,
+        if_not_exists=True,
+    )
+
+
+def downgrade():
+    op.drop_index("uq_users_email_lower", table_name="users")
+    op.drop_index("uq_users_username_lower", table_name="users")
+    op.drop_table("users")
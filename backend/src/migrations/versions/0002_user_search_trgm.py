@@ -0,0 +1,41 @@
+"""trigram indexes for user search
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+GIN indexes over lower(username/first_name/last_name) with gin_trgm_ops,
+serving the prefix (LIKE 'q%') and similarity (%) filters of
+pg_client.search_users. Built CONCURRENTLY so large tables stay writable.
+PostgreSQL only; other databases (SQLite in tests) search without them.
+"""
+
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+_COLUMNS = ("username", "first_name", "last_name")
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CREATE INDEX CONCURRENTLY can't run inside the migration's transaction
+    with op.get_context().autocommit_block():
+        for column in _COLUMNS:
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_{column}_trgm "
+                f"ON users USING gin (lower({column}) gin_trgm_ops)"
+            )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    with op.get_context().autocommit_block():
+        for column in _COLUMNS:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS ix_users_{column}_trgm")
@@ -3,6 +3,7 @@ from .user import (
     UserBase,
     User,
     UserCreate,
+    UserBatchRead,
     UserRead,
     UserUpdate,
 )
@@ -12,6 +13,7 @@ __all__ = [
     "UserBase",
     "User",
     "UserCreate",
+    "UserBatchRead",
     "UserRead",
     "UserUpdate",
 ]
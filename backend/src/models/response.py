@@ -2,11 +2,23 @@ from typing import Any, Generic, TypeVar
 
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
+from pydantic_core import to_json
 
 
 T = TypeVar("T")
 
 
+class ModelJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered by pydantic-core, so models go straight to bytes
+    without an intermediate model_dump() dict or the stdlib json encoder.
+    The app's default response class, so route results render with it too.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return to_json(content)
+
+
 class BaseResponse(BaseModel, Generic[T]):
     detail: str
     status: int
@@ -21,5 +33,5 @@ class BaseResponse(BaseModel, Generic[T]):
     def error(cls, detail: str, status: int = 500, **kwargs) -> "BaseResponse":
         return cls(detail=detail, status=status, data=None, **kwargs)
 
-    def to_json_response(self) -> JSONResponse:
-        return JSONResponse(status_code=self.status, content=self.model_dump())
+    def to_json_response(self) -> ModelJSONResponse:
+        return ModelJSONResponse(status_code=self.status, content=self)
@@ -1,4 +1,5 @@
 from pydantic import EmailStr, field_validator
+from sqlalchemy import Index, func
 from sqlmodel import SQLModel, Field
 
 from lib.validators import validate_name, validate_password, validate_username
@@ -28,6 +29,12 @@ class User(UserBase, table=True):
     verified: bool = Field(default=False)
 
 
+# Lookups filter on lower(username)/lower(email); these functional indexes
+# serve them with an index scan and enforce case-insensitive uniqueness
+Index("uq_users_username_lower", func.lower(User.username), unique=True)
+Index("uq_users_email_lower", func.lower(User.email), unique=True)
+
+
 class UserCreate(UserBase):
     password: str = Field(nullable=False)
 
@@ -42,6 +49,10 @@ class UserRead(UserBase):
     verified: bool
 
 
+class UserBatchRead(SQLModel):
+    usernames: list[str] = Field(..., min_length=1)
+
+
 class UserUpdate(UserBase):
     username: str | None = Field(None, min_length=3, max_length=50)
     first_name: str | None = Field(None, nullable=True, max_length=100)
@@ -3,49 +3,52 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import Response
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from services.pg_client import depends_get_db, get_user, get_user_by_email, get_user_by_username, insert_user, update_user
+from services.pg_client import UserConflictError, depends_get_db, insert_user, update_user
 from logger import get_api_logger
 from models import BaseResponse, UserCreate, UserRead, User
 
-from lib.http_exception import UserNotFoundException
+from lib.http_exception import ServiceUnavailableException, UserNotFoundException
 from lib.jwt import delete_access_token_cookie, issue_access_token, issue_verify_token, set_access_token_cookie
 from lib.links import get_2fa_link, get_verification_link
 from lib.utils import get_client_ip, mask_email, now
-from lib.crypto import hash_password
-from lib.auth import get_user_from_token, require_authenticated, require_unauthenticated, validate_credentials
+from lib.crypto import hash_password_async
+from lib.auth import Identity, get_identity, require_authenticated, require_unauthenticated, validate_credentials
 
 from services.redis_client import redis_client
-from services.rate_limit import enforce_email_action_cooldown
-from services.email_client import send_2fa_email, send_verification_email
+from services.rate_limit import TokenBucket, clear_email_action_cooldown, enforce_email_action_cooldown, enforce_email_action_cooldown_and_set, rate_limit
+from services.email_client import check_email_capacity, send_2fa_email, send_verification_email
 
 from config import config
 
 api_logger = get_api_logger()
-r = redis_client.r
 
 auth_router = APIRouter()
 
+login_limiter = TokenBucket(
+    "LOGIN",
+    capacity=config.RATE_LIMIT_LOGIN_BURST,
+    refill_per_second=config.RATE_LIMIT_LOGIN_PER_MINUTE / 60,
+)
+
 
 @auth_router.post("/register", response_model=BaseResponse[UserRead])
 async def register(
     _: Annotated[None, Depends(require_unauthenticated)],
     request: Request,
     user: UserCreate,
-    db: Session = Depends(depends_get_db),
+    db: AsyncSession = Depends(depends_get_db),
     client_url: str | None = Query(None, alias="clientUrl"),
 ):
-    if get_user_by_email(db, user.email.lower()):
-        raise HTTPException(409, "A user with that email already exists.")
-
-    if get_user_by_username(db, user.username):
-        raise HTTPException(409, "A user with that username already exists.")
+    # Before anything is written, so a full email queue fails the whole request
+    if not config.DEBUG:
+        check_email_capacity()
 
-    hashed_password: str = hash_password(user.password)
+    hashed_password: str = await hash_password_async(user.password)
 
     api_logger.debug(
-        f"HASHED PASSWORD ({mask_email(user.email)}): {hashed_password[:3]}***"
+        "HASHED PASSWORD (%s): %s***", mask_email(user.email), hashed_password[:3]
     )
 
     db_user = User(
@@ -57,7 +60,12 @@ async def register(
         verified=False
     )
 
-    db_user: User = insert_user(db, db_user)
+    # The unique lower() indexes reject duplicates atomically, saving the
+    # separate email/username lookups and closing the race between them
+    try:
+        db_user: User = await insert_user(db, db_user)
+    except UserConflictError as e:
+        raise HTTPException(409, str(e))
 
     base_url = str(request.base_url).rstrip("/")
     token = issue_verify_token(user.email)
@@ -67,11 +75,20 @@ async def register(
     )  # goes to /verify
 
     if not config.DEBUG:
-        api_logger.info(f"Sending verification email to {user.email}")
-        send_verification_email(user.email, verification_link)
-        message = """User registered successfully.
-            Please verify your account using the link
-            sent to your email address."""
+        api_logger.info("Sending verification email to %s", mask_email(user.email))
+        try:
+            send_verification_email(user.email, verification_link)
+            message = """User registered successfully.
+                Please verify your account using the link
+                sent to your email address."""
+        except ServiceUnavailableException:
+            # The queue filled up since the check; the user exists regardless,
+            # so don't report the registration as failed
+            api_logger.error(
+                "Verification email to %s not queued", mask_email(user.email)
+            )
+            message = """User registered successfully, but the verification
+                email could not be sent. Please request a new one."""
     else:
         message = verification_link
 
@@ -94,16 +111,19 @@ async def resend_verification_email(
     _: Annotated[None, Depends(require_unauthenticated)],
     request: Request,
     username: str,
-    db: Session = Depends(depends_get_db),
+    identity: Identity = Depends(get_identity),
     client_url: str | None = Query(None, alias="clientUrl"),
 ):
-    user: User | None = get_user(db, username)
+    user: User | None = await identity.user(username)
     if not user:
         raise UserNotFoundException
 
     if user.verified:
         return BaseResponse.ok("User already verified.")
 
+    if not config.DEBUG:
+        check_email_capacity()
+
     await enforce_email_action_cooldown(user.email, "VERIFY")
 
     base_url = str(request.base_url).rstrip("/")
@@ -113,7 +133,12 @@ async def resend_verification_email(
     )  # goes to /verify
 
     if not config.DEBUG:
-        send_verification_email(user.email, verification_link)
+        try:
+            send_verification_email(user.email, verification_link)
+        except ServiceUnavailableException:
+            # Nothing was sent, so don't make the user wait out the cooldown
+            await clear_email_action_cooldown(user.email, "VERIFY")
+            raise
         return BaseResponse.ok(f"A link has been sent to {user.email}.")
     else:
         return BaseResponse.ok(verification_link)
@@ -122,36 +147,51 @@ async def resend_verification_email(
 @auth_router.get("/verify", response_model=BaseResponse[None])
 async def verify(
     _: Annotated[User, Depends(require_unauthenticated)],
-    db: Session = Depends(depends_get_db),
+    db: AsyncSession = Depends(depends_get_db),
+    identity: Identity = Depends(get_identity),
     access_token: str = Query(..., alias="token"),
 ):
     """
     Endpoint to verify JWT sent from /register
     """
-    user: User = get_user_from_token(db, access_token)
+    user: User = await identity.user_from_token(access_token)
 
     if user.verified:
         return BaseResponse.ok("User already verified.")
 
     user.verified = True
-    update_user(db, user)
+    await update_user(db, user)
 
     return BaseResponse.ok("Email verified. You may now log in.")
 
 
-@auth_router.post("/login", response_model=BaseResponse[None])
+@auth_router.post(
+    "/login",
+    response_model=BaseResponse[None],
+    dependencies=[
+        Depends(rate_limit(login_limiter, "ip")),
+        Depends(rate_limit(login_limiter, "email")),
+    ],
+)
 async def request_login(
     _: Annotated[None, Depends(require_unauthenticated)],
     request: Request,
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(depends_get_db),
+    identity: Identity = Depends(get_identity),
     client_url: str | None = Query(None, alias="clientUrl"),
 ):
-    user: User = validate_credentials(db, form_data.username, form_data.password)
+    user: User = await validate_credentials(
+        identity, form_data.username, form_data.password
+    )
+
+    if not config.DEBUG:
+        check_email_capacity()
 
     # Proceed to 2fa
     token = issue_access_token(user.email)
-    await r.set(token, "UNUSED", ex=300)  # 5 minutes
+    await enforce_email_action_cooldown_and_set(
+        user.email, "LOGIN", token, "UNUSED", ex=300  # 5 minutes
+    )
 
     verification_link = get_2fa_link(
         base_url=str(request.base_url).rstrip("/"),
@@ -159,12 +199,14 @@ async def request_login(
         client_url=client_url,
     )  # goes to /verify-login
 
-
-    await enforce_email_action_cooldown(user.email, "LOGIN")
-
     # Don't send emails in debug
     if not config.DEBUG:
-        send_2fa_email(user.email, verification_link)
+        try:
+            send_2fa_email(user.email, verification_link)
+        except ServiceUnavailableException:
+            # Nothing was sent, so don't make the user wait out the cooldown
+            await clear_email_action_cooldown(user.email, "LOGIN", token)
+            raise
         return BaseResponse.ok(
             "Please login using the link sent to your email address."
         )
@@ -178,35 +220,33 @@ async def confirm_login(
     request: Request,
     response: Response,
     token: str,
-    db: Session = Depends(depends_get_db),
+    identity: Identity = Depends(get_identity),
 ):
     """
     Endpoint to verify JWT sent from /login
     """
 
-    # Ensure login token is only used once
-    token_state: str = await r.get(token)
+    ip = get_client_ip(request)
+    ip = ip if ip else "UNKNOWN"
 
-    # if token_state and token_state.startswith("USED"):
-    #     raise HTTPException(409, "This link has already been used.")
+    # Ensure login token is only used once
+    token_state: str | None = await redis_client.claim(
+        token, "UNUSED", f"USED - {ip} - {now().timestamp()}"
+    )
 
     if not token_state:
         raise HTTPException(400, "Invalid or expired token.")
 
-    user: User = get_user_from_token(db, token)
+    if token_state != "UNUSED":
+        raise HTTPException(409, "This link has already been used.")
+
+    user: User = await identity.user_from_token(token)
 
     access_token = issue_access_token(user.email)
-    api_logger.debug(f"ACCESS TOKEN: {access_token[:5]}...")
+    api_logger.debug("ACCESS TOKEN: %s...", access_token[:5])
 
     set_access_token_cookie(response, access_token)
 
-    timestamp = now().timestamp
-
-    ip = get_client_ip(request)
-    ip = ip if ip else "UNKNOWN"
-
-    await r.set(token, f"USED - {ip} - {timestamp}")
-
     return BaseResponse.ok("Authenticated.")
 
 
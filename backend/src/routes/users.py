@@ -1,15 +1,29 @@
+import base64
+import json
 from typing import Annotated
-from fastapi import APIRouter, Depends, Query, Response
-from sqlmodel import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from services.pg_client import depends_get_db, get_user_by_username
+from services.pg_client import (
+    depends_get_db,
+    get_user_by_username,
+    get_users,
+    get_users_by_usernames,
+    search_users,
+)
+from services.rate_limit import SlidingWindow, rate_limit
 from logger import get_api_logger
 from lib.http_exception import UserNotFoundException
 from lib.auth import is_user_verified, require_authenticated, user_exists
-from models import BaseResponse, User, UserRead
+from models import BaseResponse, User, UserBatchRead, UserRead
+from config import config
 
 users_router = APIRouter()
 
+check_exists_limiter = SlidingWindow(
+    "CHECK_EXISTS", limit=config.RATE_LIMIT_CHECK_EXISTS_PER_MINUTE, window_seconds=60
+)
+
 
 @users_router.get("/get-current", response_model=BaseResponse[UserRead])
 async def get_current_user(
@@ -19,30 +33,101 @@ async def get_current_user(
     return BaseResponse[UserRead].ok(data=UserRead(**current_user.model_dump()))
 
 
-@users_router.get("/check-exists", response_model=BaseResponse[str])
-async def get_user_exists(db: Session = Depends(depends_get_db), username: str = Query(...)):
-    exists: bool = user_exists(db, username)
-    get_api_logger().info(f"USER {username} EXISTS: {exists}")
+@users_router.get(
+    "/check-exists",
+    response_model=BaseResponse[str],
+    dependencies=[Depends(rate_limit(check_exists_limiter, "ip"))],
+)
+async def get_user_exists(db: AsyncSession = Depends(depends_get_db), username: str = Query(...)):
+    exists: bool = await user_exists(db, username)
+    get_api_logger().info("USER %s EXISTS: %s", username, exists)
     return BaseResponse[str].ok(data=str(exists).lower())
 
 
 @users_router.get("/check-verified", response_model=BaseResponse[str])
 async def get_user_verified_status(
-    db: Session = Depends(depends_get_db), username: str = Query(...)
+    db: AsyncSession = Depends(depends_get_db), username: str = Query(...)
 ):
-    verified: bool = is_user_verified(db, username)
-    get_api_logger().info(f"USER {username} VERIFIED: {verified}")
+    verified: bool = await is_user_verified(db, username)
+    get_api_logger().info("USER %s VERIFIED: %s", username, verified)
     return BaseResponse[str].ok(data=str(verified).lower())
 
 
+@users_router.get("", response_model=BaseResponse[list[UserRead]])
+async def list_users(
+    current_user: Annotated[User, Depends(require_authenticated)],
+    db: AsyncSession = Depends(depends_get_db),
+    cursor: int | None = Query(None, description="id of the last user seen"),
+    limit: int = Query(50, ge=1),
+):
+    """Users ordered by id; pass meta.next_cursor back as cursor for the next page"""
+    page_size = min(limit, config.USERS_PAGE_LIMIT)
+    users = await get_users(db, after_id=cursor, limit=page_size)
+    # A short page is the last one
+    next_cursor = users[-1].id if len(users) == page_size else None
+    return BaseResponse[list[UserRead]].ok(data=users, meta={"next_cursor": next_cursor})
+
+
+@users_router.post("/batch", response_model=BaseResponse[list[UserRead]])
+async def batch_get_users(
+    batch: UserBatchRead,
+    current_user: Annotated[User, Depends(require_authenticated)],
+    db: AsyncSession = Depends(depends_get_db),
+):
+    """Resolves many usernames at once; those not found are listed in meta.missing"""
+    if len(batch.usernames) > config.USERS_BATCH_LIMIT:
+        raise HTTPException(400, f"At most {config.USERS_BATCH_LIMIT} usernames per request.")
+    users = await get_users_by_usernames(db, batch.usernames)
+    found = {user.username.lower() for user in users}
+    missing = [username for username in batch.usernames if username.lower() not in found]
+    return BaseResponse[list[UserRead]].ok(data=users, meta={"missing": missing})
+
+
+def _encode_search_cursor(rank: float, user_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([rank, user_id]).encode()).decode()
+
+
+def _decode_search_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        rank, user_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return float(rank), int(user_id)
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor.")
+
+
+@users_router.get("/search", response_model=BaseResponse[list[UserRead]])
+async def route_search_users(
+    current_user: Annotated[User, Depends(require_authenticated)],
+    db: AsyncSession = Depends(depends_get_db),
+    q: str = Query(..., min_length=1, max_length=50),
+    cursor: str | None = Query(None, description="meta.next_cursor of the previous page"),
+    limit: int = Query(20, ge=1),
+):
+    """Prefix/fuzzy search over username, first and last name, best match first"""
+    # An empty pattern would match (and page through) every user
+    q = q.strip()
+    if not q:
+        raise HTTPException(400, "Search query must not be blank.")
+    page_size = min(limit, config.USERS_PAGE_LIMIT)
+    after = _decode_search_cursor(cursor) if cursor else None
+    results = await search_users(db, q, limit=page_size, after=after)
+    next_cursor = None
+    if len(results) == page_size:
+        last_user, last_rank = results[-1]
+        next_cursor = _encode_search_cursor(last_rank, last_user.id)
+    return BaseResponse[list[UserRead]].ok(
+        data=[user for user, _ in results], meta={"next_cursor": next_cursor}
+    )
+
+
 @users_router.get("/{username}", response_model=BaseResponse[UserRead])
 async def route_get_user_by_username(
     response: Response,
     username: str,
     current_user: Annotated[User, Depends(require_authenticated)],
-    db: Session = Depends(depends_get_db),
+    db: AsyncSession = Depends(depends_get_db),
 ):
-    user = get_user_by_username(db, username)
+    user = await get_user_by_username(db, username)
     if not user:
         raise UserNotFoundException
     return BaseResponse[UserRead].ok(data=UserRead(**user.model_dump()))
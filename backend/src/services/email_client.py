@@ -1,13 +1,205 @@
+import asyncio
 import smtplib
 from email.message import EmailMessage
 
 from config import config
+from lib.http_exception import ServiceUnavailableException
+from logger import get_email_logger
+from services import tracing
+
+
+class SinkSMTP:
+    """
+    Stand-in for smtplib.SMTP_SSL that keeps messages in memory.
+    Selected with EMAIL_BACKEND=sink for tests and local development.
+    """
+
+    outbox: list[EmailMessage] = []
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+
+    def login(self, user: str, password: str):
+        pass
+
+    def send_message(self, msg: EmailMessage):
+        SinkSMTP.outbox.append(msg)
+        get_email_logger().info("[sink] %s -> %s", msg["Subject"], msg["To"])
+
+    def quit(self):
+        pass
+
+
+class _SMTPConnection:
+    """
+    A single authenticated SMTP session, reused across messages.
+    Blocking; only ever used from a worker thread.
+    """
+
+    def __init__(self):
+        self.smtp: smtplib.SMTP_SSL | SinkSMTP | None = None
+
+    def _connect(self):
+        smtp_class = SinkSMTP if config.EMAIL_BACKEND == "sink" else smtplib.SMTP_SSL
+        self.smtp = smtp_class(config.SMTP_HOST, config.SMTP_PORT)
+        self.smtp.login(config.EMAIL_ADDRESS, config.EMAIL_PASSWORD)
+
+    def close(self):
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.smtp = None
+
+    def _send(self, msg: EmailMessage):
+        if self.smtp is None:
+            self._connect()
+        self.smtp.send_message(msg)  # type: ignore[union-attr]
+
+    def send_batch(self, messages: list[EmailMessage]) -> list[Exception | None]:
+        """Send messages over the current session, returning an error (or None) per message"""
+        results: list[Exception | None] = []
+        for msg in messages:
+            try:
+                try:
+                    self._send(msg)
+                except smtplib.SMTPServerDisconnected:
+                    # The server dropped an idle session; reconnect once
+                    self.close()
+                    self._send(msg)
+                results.append(None)
+            except (smtplib.SMTPException, OSError) as e:
+                self.close()
+                results.append(e)
+        return results
+
+
+class _EmailClient:
+
+    def __new__(cls):
+        if not hasattr(cls, "instance"):
+            cls.instance = super(_EmailClient, cls).__new__(cls)
+            cls.instance._init()
+        return cls.instance
+
+    def _init(self):
+        self.logger = get_email_logger()
+        self.queue: asyncio.Queue[tuple[EmailMessage, int]] = asyncio.Queue(
+            maxsize=config.EMAIL_QUEUE_SIZE
+        )
+        self.workers: list[asyncio.Task] = []
+        self.retries: set[asyncio.Task] = set()
+
+    async def start(self):
+        self.logger.info("Starting %d email workers...", config.EMAIL_WORKERS)
+        for worker_id in range(config.EMAIL_WORKERS):
+            self.workers.append(asyncio.create_task(self._worker(worker_id)))
+
+    async def _drain(self):
+        # Workers schedule a retry before marking its message done, so once
+        # join() returns every retry still owed is in self.retries
+        while True:
+            await self.queue.join()
+            if not self.retries:
+                return
+            await asyncio.wait(set(self.retries))
+
+    async def stop(self, timeout: float = 0):
+        """Give queued and retrying emails up to timeout seconds, then stop the workers"""
+        if timeout > 0 and self.workers:
+            try:
+                await asyncio.wait_for(self._drain(), timeout)
+            except TimeoutError:
+                pass
+        # Including when there was no time left to drain at all
+        if self.pending():
+            self.logger.error("Stopping with %d emails undelivered", self.pending())
+
+        for task in [*self.workers, *self.retries]:
+            task.cancel()
+        await asyncio.gather(*self.workers, *self.retries, return_exceptions=True)
+        self.workers.clear()
+        self.retries.clear()
+
+    def enqueue(self, msg: EmailMessage, attempt: int = 0):
+        try:
+            self.queue.put_nowait((msg, attempt))
+        except asyncio.QueueFull:
+            self.logger.error("Email queue full, dropping %s", msg["Subject"])
+            raise ServiceUnavailableException
+
+    def check_capacity(self):
+        """Raise as enqueue would on a full queue, before the caller's side effects"""
+        if self.queue.full():
+            self.logger.error("Email queue full, rejecting request")
+            raise ServiceUnavailableException
+
+    def pending(self) -> int:
+        return self.queue.qsize() + len(self.retries)
+
+    async def _retry(self, msg: EmailMessage, attempt: int):
+        await asyncio.sleep(min(2**attempt, 60))
+        # Nobody is waiting on this task to report a full queue to, so wait
+        # for room instead of dropping (or raising out of) the retry
+        await self.queue.put((msg, attempt))
+
+    def _schedule_retry(self, msg: EmailMessage, attempt: int, error: Exception):
+        if attempt >= config.EMAIL_MAX_RETRIES:
+            self.logger.error(
+                "Giving up on %s to %s: %s", msg["Subject"], msg["To"], error
+            )
+            return
+        self.logger.warning("Email send failed (attempt %d): %s", attempt + 1, error)
+        task = asyncio.create_task(self._retry(msg, attempt + 1))
+        self.retries.add(task)
+        task.add_done_callback(self.retries.discard)
+
+    async def _worker(self, worker_id: int):
+        connection = _SMTPConnection()
+        try:
+            while True:
+                batch = [await self.queue.get()]
+                while len(batch) < config.EMAIL_BATCH_SIZE and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+
+                try:
+                    try:
+                        errors = await asyncio.to_thread(
+                            connection.send_batch, [msg for msg, _ in batch]
+                        )
+                    except Exception as e:
+                        # send_batch reports SMTP errors per message; anything
+                        # else fails the batch, and must not end the worker
+                        self.logger.exception("Email batch failed: %s", e)
+                        await asyncio.to_thread(connection.close)
+                        errors = [e] * len(batch)
+
+                    for (msg, attempt), error in zip(batch, errors):
+                        if error is not None:
+                            self._schedule_retry(msg, attempt, error)
+                finally:
+                    # Always, or stop() would wait out its timeout in join()
+                    for _ in batch:
+                        self.queue.task_done()
+        finally:
+            await asyncio.to_thread(connection.close)
+
+
+email_client = _EmailClient()
 
 
 def send_email(msg: EmailMessage):
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-        smtp.login(config.EMAIL_ADDRESS, config.EMAIL_PASSWORD)
-        smtp.send_message(msg)
+    """Queue msg for delivery by the background workers"""
+    with tracing.span("email.enqueue", queued=email_client.pending()):
+        email_client.enqueue(msg)
+
+
+def check_email_capacity():
+    """Fail fast with 503 if an email couldn't be queued right now"""
+    email_client.check_capacity()
 
 
 def send_verification_email(email: str, link: str):
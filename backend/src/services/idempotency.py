@@ -0,0 +1,82 @@
+import asyncio
+from hashlib import sha256
+
+from pydantic import BaseModel
+from redis.exceptions import RedisError
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.types import Scope
+
+from lib.utils import get_client_ip
+from logger import get_redis_logger
+from services.redis_client import redis_client
+
+logger = get_redis_logger()
+
+
+class RecordedResponse(BaseModel):
+    status: int
+    headers: list[tuple[str, str]]
+    body: str
+    # Of the request body, when an Idempotency-Key stood in for it
+    request_hash: str | None = None
+
+
+# Requests currently executing in this worker, by fingerprint; identical
+# requests arriving meanwhile wait on the future instead of re-executing
+in_flight: dict[str, asyncio.Future[RecordedResponse | None]] = {}
+
+
+def fingerprint(scope: Scope, body: bytes, idempotency_key: str | None) -> str:
+    """
+    Identify a request by caller, method and target. With an Idempotency-Key
+    the key stands in for the body; otherwise the body itself is hashed.
+    """
+    headers = Headers(scope=scope)
+    digest = sha256()
+    for part in (
+        get_client_ip(Request(scope)) or "",
+        headers.get("cookie", ""),
+        headers.get("authorization", ""),
+        scope["method"],
+        scope["path"],
+        scope.get("query_string", b"").decode("latin-1"),
+    ):
+        digest.update(part.encode())
+        digest.update(b"\0")
+
+    if idempotency_key:
+        digest.update(b"key:" + idempotency_key.encode())
+    else:
+        digest.update(b"body:" + body)
+
+    return digest.hexdigest()
+
+
+def request_hash(body: bytes) -> str:
+    """Recorded with keyed responses, so a key reused with another body is caught"""
+    return sha256(body).hexdigest()
+
+
+def _key(fingerprint: str) -> str:
+    return f"IDEMPOTENCY_{fingerprint}"
+
+
+async def get_response(fingerprint: str) -> RecordedResponse | None:
+    try:
+        cached: str | None = await redis_client.r.get(_key(fingerprint))
+    except RedisError as e:
+        logger.warning("Idempotency lookup failed: %s", e)
+        return None
+    if cached is None:
+        return None
+    return RecordedResponse.model_validate_json(cached)
+
+
+async def store_response(fingerprint: str, response: RecordedResponse, ttl_ms: int):
+    try:
+        await redis_client.r.set(
+            _key(fingerprint), response.model_dump_json(), px=ttl_ms
+        )
+    except RedisError as e:
+        logger.warning("Idempotency store failed: %s", e)
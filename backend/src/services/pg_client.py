@@ -1,99 +1,355 @@
-from sqlmodel import Session, create_engine, SQLModel, text
+from time import perf_counter
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel import and_, case, func, or_, select, text
+from sqlmodel.ext.asyncio.session import AsyncSession
 from config import config
+from lib.utils import mask_email
+from logger import get_postgres_logger
+from models import User, UserRead
+from services import metrics, tracing, user_bloom, user_cache
 
 PG_URL = (
-    f"postgresql+psycopg2://{config.PG_USER}:{config.PG_PASSWORD}"
+    f"postgresql+asyncpg://{config.PG_USER}:{config.PG_PASSWORD}"
     f"@{config.PG_HOST}:{config.PG_PORT}/{config.PG_NAME}"
 )
 
-engine = create_engine(PG_URL)
-SQLModel.metadata.create_all(engine)
+
+def _connect_args() -> dict:
+    if config.PG_STATEMENT_TIMEOUT_MS <= 0:
+        return {}
+    return {
+        "server_settings": {"statement_timeout": str(config.PG_STATEMENT_TIMEOUT_MS)}
+    }
+
+
+# Created by init() from the app lifespan (or the CLI), not at import time
+engine: AsyncEngine | None = None
+async_session: async_sessionmaker[AsyncSession] | None = None
+
+logger = get_postgres_logger()
+
+
+class UserConflictError(Exception):
+    """Raised by insert_user when the username or email is already taken"""
+
+    def __init__(self, field: str):
+        super().__init__(f"A user with that {field} already exists.")
+        self.field = field
+
+
+# Unique index name -> the field reported in UserConflictError
+_UNIQUE_INDEXES = {
+    "uq_users_email_lower": "email",
+    "uq_users_username_lower": "username",
+}
+
+
+class _PoolStats:
+    """Cumulative pool counters, complementing the live figures from engine.pool"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float):
+        self.waits += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+
+pool_stats = _PoolStats()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Times how long each checkout queues for a connection (or opens a new
+    one), excluding the pre-ping. Checkouts stay lazy: requests that never
+    query, or query only after slow work like password hashing, don't hold
+    or wait for a connection until then.
+    """
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        pool_stats.record_wait(perf_counter() - start)
+        return connection
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_stats.checkouts += 1
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_start"] = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info.pop("query_start")
+    metrics.db_query_duration.observe(elapsed)
+    tracing.record("db.query", elapsed, statement=statement.split(None, 1)[0])
+
+
+def init():
+    """Create the engine and session factory; a no-op if already created"""
+    global engine, async_session
+    if engine is not None:
+        return
+
+    logger.info("Initializing PostgreSQL engine...")
+    engine = create_async_engine(
+        PG_URL,
+        poolclass=InstrumentedPool,
+        pool_size=config.PG_POOL_SIZE,
+        max_overflow=config.PG_MAX_OVERFLOW,
+        pool_timeout=config.PG_POOL_TIMEOUT,
+        pool_recycle=config.PG_POOL_RECYCLE,
+        pool_pre_ping=config.PG_POOL_PRE_PING,
+        connect_args=_connect_args(),
+    )
+    event.listen(engine.sync_engine, "checkout", _on_checkout)
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+    # expire_on_commit=False: attributes can't be lazy-loaded outside of an
+    # awaited call, so keep committed objects usable after the session commits
+    async_session = async_sessionmaker(
+        engine, class_=AsyncSession, expire_on_commit=False
+    )
+
+
+async def dispose():
+    """Close all pooled connections; init() may be called again afterwards"""
+    global engine, async_session
+    if engine is None:
+        return
+
+    logger.info("Disposing PostgreSQL engine...")
+    await engine.dispose()
+    engine = None
+    async_session = None
+
+
+def get_pool_stats() -> dict:
+    if engine is None:
+        return {}
+    pool = engine.pool
+    waits = pool_stats.waits
+    return {
+        "pool_size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": config.PG_MAX_OVERFLOW,
+        "checkouts": pool_stats.checkouts,
+        "timeouts": pool_stats.timeouts,
+        "wait_ms_avg": (
+            pool_stats.wait_seconds_total / waits * 1000 if waits else 0.0
+        ),
+        "wait_ms_max": pool_stats.wait_seconds_max * 1000,
+    }
 
 
 # Dependency function for FastAPI
-def depends_get_db():
-    with Session(engine) as session:
-        yield session
+async def depends_get_db():
+    async with async_session() as session:  # type: ignore[misc]
+        # The connection is checked out by the first query, so a pool
+        # timeout surfaces from the route body
+        try:
+            yield session
+        except PoolTimeoutError:
+            logger.error("Connection pool exhausted: %s", get_pool_stats())
+            raise HTTPException(503, "Database is busy. Please try again.")
 
 
-def get_db():
-    session = Session(engine)
-    try:
-        return session
-    finally:
-        session.close()
+# Only the columns UserRead exposes, so listings never load hashed_password
+_USER_READ_COLUMNS = tuple(getattr(User, name) for name in UserRead.model_fields)
 
 
-from sqlmodel import Session, func, select
-from lib.utils import mask_email
-from logger import get_postgres_logger
-from models import User
+async def get_users(
+    session: AsyncSession, after_id: int | None = None, limit: int = 50
+) -> list[UserRead]:
+    """One keyset page ordered by id, starting after after_id"""
+    statement = select(*_USER_READ_COLUMNS).order_by(User.id).limit(limit)
+    if after_id is not None:
+        statement = statement.where(User.id > after_id)
+    rows = (await session.exec(statement)).all()
+    return [UserRead.model_validate(row._mapping) for row in rows]
 
-logger = get_postgres_logger()
+
+async def get_users_by_usernames(
+    session: AsyncSession, usernames: list[str]
+) -> list[UserRead]:
+    """Resolves many usernames (case-insensitively) in a single IN query"""
+    if not usernames:
+        return []
+    statement = select(*_USER_READ_COLUMNS).where(
+        func.lower(User.username).in_({username.lower() for username in usernames})
+    )
+    rows = (await session.exec(statement)).all()
+    return [UserRead.model_validate(row._mapping) for row in rows]
 
 
-def get_users(session: Session) -> list[User]:
-    users = session.exec(select(User)).all()
-    return list(users)
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 
-def get_user(session: Session, identifier: str) -> User | None:
-    if "@" in identifier:
-        return get_user_by_email(session, identifier)
+def _search_rank(dialect: str, q: str):
+    """
+    Relevance of a row to q, plus the filter selecting the candidates.
+    PostgreSQL matches prefixes and trigram similarity (served by the GIN
+    indexes from migration 0002); other databases only match prefixes.
+    """
+    columns = [
+        func.lower(getattr(User, name))
+        for name in ("username", "first_name", "last_name")
+    ]
+    prefix = f"{_escape_like(q)}%"
+    prefix_matches = [column.like(prefix, escape="\\") for column in columns]
+
+    if dialect == "postgresql":
+        # An exact prefix of the username ranks first, then closest match
+        rank = func.greatest(*(func.similarity(column, q) for column in columns))
+        rank = case((prefix_matches[0], 1.0 + rank), else_=rank)
+        matches = or_(*prefix_matches, *(column.op("%")(q) for column in columns))
     else:
-        return get_user_by_username(session, identifier)
+        rank = case((prefix_matches[0], 2.0), else_=1.0)
+        matches = or_(*prefix_matches)
+    return rank, matches
+
+
+async def search_users(
+    session: AsyncSession,
+    q: str,
+    limit: int = 20,
+    after: tuple[float, int] | None = None,
+) -> list[tuple[UserRead, float]]:
+    """
+    Users matching q by username or name, best match first (ties by id).
+    after is the (rank, id) of the last result of the previous page.
+    """
+    dialect = session.bind.dialect.name  # type: ignore[union-attr]
+    rank, matches = _search_rank(dialect, q.strip().lower())
+    ranked = (
+        select(*_USER_READ_COLUMNS, rank.label("rank")).where(matches).subquery()
+    )
+    statement = (
+        select(*ranked.c).order_by(ranked.c.rank.desc(), ranked.c.id).limit(limit)
+    )
+    if after is not None:
+        after_rank, after_id = after
+        statement = statement.where(
+            or_(
+                ranked.c.rank < after_rank,
+                and_(ranked.c.rank == after_rank, ranked.c.id > after_id),
+            )
+        )
+    rows = (await session.exec(statement)).all()
+    return [(UserRead.model_validate(row._mapping), row.rank) for row in rows]
 
 
-def get_user_by_username(session: Session, username: str) -> User | None:
-    logger.info(f"Searching for user {username}")
+async def get_user(
+    session: AsyncSession, identifier: str, use_cache: bool = True
+) -> User | None:
+    """
+    Read-through: served from user_cache when possible, DB otherwise.
+    Cached users lack hashed_password; pass use_cache=False when it's needed.
+    """
+    with tracing.span("get_user") as attributes:
+        cached = await user_cache.get(identifier) if use_cache else None
+        miss = cached if isinstance(cached, user_cache.NotCached) else None
+        attributes["cached"] = use_cache and miss is None
+        if attributes["cached"]:
+            return cached  # type: ignore[return-value]
+
+        if "@" in identifier:
+            user = await get_user_by_email(session, identifier)
+        else:
+            user = await get_user_by_username(session, identifier)
+
+        if miss is not None:
+            await user_cache.put(identifier, user, miss)
+        return user
+
+
+async def get_user_by_username(session: AsyncSession, username: str) -> User | None:
+    logger.debug("Searching for user %s", username)
     statement = select(User).where(func.lower(User.username) == username.lower())
-    result = session.exec(statement)
+    result = await session.exec(statement)
     return result.first()
 
 
-def get_user_by_email(session: Session, email: str) -> User | None:
-    logger.info(f"Searching for user {mask_email(email)}")
+async def get_user_by_email(session: AsyncSession, email: str) -> User | None:
+    logger.debug("Searching for user %s", mask_email(email))
     statement = select(User).where(func.lower(User.email) == email.lower())
-    result = session.exec(statement)
+    result = await session.exec(statement)
     return result.first()
 
 
-def insert_user(session: Session, user: User) -> User:
-    logger.info(f"Inserting user {mask_email(user.email)}")
-    logger.info(user.model_dump_json())
+async def insert_user(session: AsyncSession, user: User) -> User:
+    logger.info("Inserting user %s", mask_email(user.email))
+    # Before the commit, so the name is never reported available once taken
+    await user_bloom.add(user.email, user.username)
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    try:
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
+        for index, field in _UNIQUE_INDEXES.items():
+            if index in str(e.orig):
+                raise UserConflictError(field) from e
+        raise
+    await session.refresh(user)
+    # Drop any negative entries for the new username/email
+    await user_cache.invalidate(user.email, user.username)
     return user
 
 
-def delete_user(session: Session, user_id: int) -> bool:
-    user = session.get(User, user_id)
+async def delete_user(session: AsyncSession, user_id: int) -> bool:
+    user = await session.get(User, user_id)
     if user:
-        session.delete(user)
-        session.commit()
+        await session.delete(user)
+        await session.commit()
+        # user_bloom keeps the old bits; they only cost a lookup until rebuilt
+        await user_cache.invalidate(user.email, user.username)
         return True
     return False
 
 
-def update_user(session: Session, user: User) -> User:
-    db_user = session.get(User, user.id)
+async def update_user(session: AsyncSession, user: User) -> User:
+    db_user = await session.get(User, user.id)
     if not db_user:
         raise ValueError(f"User with id {user.id} not found")
 
+    # Keep the old identifiers so a username/email change invalidates them too
+    previous = (db_user.email, db_user.username)
+
     for key, value in user.model_dump(exclude_unset=True).items():
         setattr(db_user, key, value)
 
+    await user_bloom.add(db_user.email, db_user.username)
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await session.refresh(db_user)
+    await user_cache.invalidate(*previous, db_user.email, db_user.username)
     return db_user
 
 
-def test_connection(session: Session) -> bool:
+async def test_connection(session: AsyncSession) -> bool:
     logger.info("Testing connection to PostgreSQL...")
     try:
-        session.connection().execute(text("SELECT 1"))
+        connection = await session.connection()
+        await connection.execute(text("SELECT 1"))
         logger.info("PostgreSQL connection successful")
         return True
     except Exception as e:
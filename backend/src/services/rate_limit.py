@@ -1,9 +1,212 @@
-from fastapi import HTTPException
-from datetime import datetime
-from lib.utils import now
+import math
+import time
+from collections import deque
+from typing import Callable
+
+from fastapi import HTTPException, Request
+from redis.exceptions import RedisError
+
+from config import config
+from lib.jwt import parse_jwt
+from lib.utils import get_client_ip
+from logger import get_redis_logger
 from services.redis_client import redis_client
 
-r = redis_client.r
+logger = get_redis_logger()
+
+# Both scripts return 0 when the hit is allowed, otherwise the milliseconds
+# until it would be. Time comes from Redis so workers share one clock.
+
+# KEYS[1] bucket; ARGV: capacity, refill rate (tokens per second)
+_TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait_ms = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait_ms = math.ceil((1 - tokens) / rate * 1000)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return wait_ms
+"""
+
+# KEYS[1] log; ARGV: limit, window (ms)
+_SLIDING_WINDOW = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+if redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], now, t[1] .. t[2] .. math.random())
+    redis.call('PEXPIRE', KEYS[1], window)
+    return 0
+end
+
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return math.max(1, tonumber(oldest[2]) + window - now)
+"""
+
+class _MemoryBackend:
+    """
+    Per-worker fallback used when RATE_LIMIT_BACKEND=memory or Redis is
+    unreachable. Limits are then enforced per worker rather than globally.
+    """
+
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self.buckets: dict[str, tuple[float, float]] = {}
+        self.logs: dict[str, deque[float]] = {}
+
+    def _evict(self, store: dict):
+        if len(store) > self.MAX_KEYS:
+            # Oldest insertions first; good enough to bound memory
+            for key in list(store)[: len(store) - self.MAX_KEYS]:
+                del store[key]
+
+    def token_bucket(self, key: str, capacity: int, rate: float) -> int:
+        now = time.monotonic()
+        tokens, ts = self.buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - ts) * rate)
+
+        wait_ms = 0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait_ms = math.ceil((1 - tokens) / rate * 1000)
+
+        self.buckets[key] = (tokens, now)
+        self._evict(self.buckets)
+        return wait_ms
+
+    def sliding_window(self, key: str, limit: int, window_ms: int) -> int:
+        now = time.monotonic() * 1000
+        log = self.logs.setdefault(key, deque())
+        while log and log[0] <= now - window_ms:
+            log.popleft()
+
+        if len(log) < limit:
+            log.append(now)
+            self._evict(self.logs)
+            return 0
+        return max(1, math.ceil(log[0] + window_ms - now))
+
+
+_memory_backend = _MemoryBackend()
+
+
+class TokenBucket:
+    """Allows bursts of up to capacity hits, refilled at refill_per_second"""
+
+    def __init__(self, name: str, capacity: int, refill_per_second: float):
+        self.name = name
+        self.capacity = capacity
+        self.rate = refill_per_second
+
+    async def hit(self, key: str) -> int:
+        """Record a hit; returns 0 if allowed, else milliseconds to wait"""
+        key = f"RATE_LIMIT_{self.name}_{key}"
+        if config.RATE_LIMIT_BACKEND == "redis":
+            try:
+                return int(
+                    await redis_client.run_script(
+                        _TOKEN_BUCKET, keys=[key], args=[self.capacity, self.rate]
+                    )
+                )
+            except RedisError as e:
+                logger.warning("Rate limiter falling back to memory: %s", e)
+        return _memory_backend.token_bucket(key, self.capacity, self.rate)
+
+
+class SlidingWindow:
+    """Allows at most limit hits in any window_seconds period"""
+
+    def __init__(self, name: str, limit: int, window_seconds: int):
+        self.name = name
+        self.limit = limit
+        self.window_ms = window_seconds * 1000
+
+    async def hit(self, key: str) -> int:
+        """Record a hit; returns 0 if allowed, else milliseconds to wait"""
+        key = f"RATE_LIMIT_{self.name}_{key}"
+        if config.RATE_LIMIT_BACKEND == "redis":
+            try:
+                return int(
+                    await redis_client.run_script(
+                        _SLIDING_WINDOW, keys=[key], args=[self.limit, self.window_ms]
+                    )
+                )
+            except RedisError as e:
+                logger.warning("Rate limiter falling back to memory: %s", e)
+        return _memory_backend.sliding_window(key, self.limit, self.window_ms)
+
+
+async def _identify(request: Request, key: str) -> str:
+    ip = get_client_ip(request) or "UNKNOWN"
+    if key == "ip":
+        return ip
+    if key == "route":
+        return getattr(request.scope.get("route"), "path", request.url.path)
+    if key == "user":
+        try:
+            return parse_jwt(request.cookies.get("access_token"))["sub"].lower()
+        except HTTPException:
+            return ip
+    if key == "email":
+        identifier = request.query_params.get("username") or request.query_params.get(
+            "email"
+        )
+        if not identifier and request.headers.get("content-type", "").startswith(
+            ("application/x-www-form-urlencoded", "multipart/form-data")
+        ):
+            form = await request.form()
+            identifier = form.get("username") or form.get("email")
+        return str(identifier).lower() if identifier else ip
+    raise ValueError(f"Unknown rate limit key: {key}")
+
+
+def rate_limit(limiter: TokenBucket | SlidingWindow, key: str = "ip") -> Callable:
+    """
+    FastAPI dependency enforcing limiter per ip, user, email or route.
+    Raises HTTPException(429) with a Retry-After header when exceeded.
+    """
+
+    async def dependency(request: Request):
+        identity = await _identify(request, key)
+        wait_ms = await limiter.hit(f"{key.upper()}_{identity}")
+        if wait_ms:
+            retry_after = math.ceil(wait_ms / 1000)
+            raise HTTPException(
+                status_code=429,
+                detail=f"Too many requests. Please wait {retry_after} seconds.",
+                headers={"Retry-After": str(retry_after)},
+            )
+
+    return dependency
+
+
+def _cooldown_key(email: str, action: str) -> str:
+    return f"{email}_{action.upper()}_LAST_REQUEST"
+
+
+def _raise_cooldown(time_left: int):
+    raise HTTPException(
+        status_code=429,
+        detail=f"Please wait {time_left} seconds before requesting again.",
+    )
 
 
 async def enforce_email_action_cooldown(
@@ -13,19 +216,33 @@ async def enforce_email_action_cooldown(
     Ensures cooldown period for an email-based action (e.g., verification, password reset).
     Raises HTTPException(429) if the cooldown has not expired yet.
     """
-    key = f"{email}_{action.upper()}_LAST_REQUEST"
-    last_request_time_str = await r.get(key)
+    time_left = await redis_client.set_cooldown(
+        _cooldown_key(email, action), cooldown_seconds
+    )
+    if time_left:
+        _raise_cooldown(time_left)
 
-    if last_request_time_str:
-        last_request_time = datetime.fromisoformat(last_request_time_str)
-        time_since_last = (now() - last_request_time).total_seconds()
 
-        if time_since_last < cooldown_seconds:
-            time_left = int(cooldown_seconds - time_since_last) 
-            raise HTTPException(
-                status_code=429,
-                detail=''.join([f"Please wait {time_left}", 
-                    "seconds before requesting again."]),
-            )
+async def enforce_email_action_cooldown_and_set(
+    email: str, action: str, key: str, value: str, ex: int, cooldown_seconds: int = 30
+):
+    """
+    Same as enforce_email_action_cooldown, also setting key to value (with
+    expiry ex) in the same atomic round-trip once the cooldown is clear.
+    """
+    time_left = await redis_client.set_with_cooldown(
+        _cooldown_key(email, action), cooldown_seconds, key, value, ex
+    )
+    if time_left:
+        _raise_cooldown(time_left)
 
-    await r.set(key, now().isoformat(), ex=cooldown_seconds)
+
+async def clear_email_action_cooldown(email: str, action: str, *keys: str):
+    """
+    Undo enforce_email_action_cooldown(_and_set), deleting any keys it set,
+    e.g. when the email it was guarding couldn't be queued.
+    """
+    try:
+        await redis_client.r.delete(_cooldown_key(email, action), *keys)
+    except RedisError as e:
+        logger.warning("Clearing %s cooldown failed: %s", action, e)
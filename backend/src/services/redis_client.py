@@ -1,7 +1,66 @@
+from time import perf_counter
+
 import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from redis.commands.core import AsyncScript
 
 from logger import get_redis_logger
 from config import config
+from services import tracing
+from services.metrics import redis_command_duration
+
+
+# Sets KEYS[2] only if the cooldown KEYS[1] was clear, starting the cooldown.
+# Returns 0 on success, otherwise the seconds left on the cooldown.
+_SET_WITH_COOLDOWN = """
+if redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[1]) then
+    redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+    return 0
+end
+return redis.call('TTL', KEYS[1])
+"""
+
+# Sets KEYS[1] to ARGV[2] (keeping its TTL) only if it currently holds ARGV[1].
+# Returns the value it held either way, or nil if the key doesn't exist.
+_CLAIM = """
+local previous = redis.call('GET', KEYS[1])
+if previous == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'KEEPTTL')
+end
+return previous
+"""
+
+
+class _InstrumentedPipeline(Pipeline):
+
+    async def execute(self, raise_on_error: bool = True):
+        commands = len(self.command_stack)
+        start = perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            elapsed = perf_counter() - start
+            redis_command_duration.labels("PIPELINE").observe(elapsed)
+            tracing.record("redis.PIPELINE", elapsed, commands=commands)
+
+
+class _InstrumentedRedis(redis.Redis):
+    """Records the round-trip time of every command and pipeline"""
+
+    async def execute_command(self, *args, **options):
+        start = perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            elapsed = perf_counter() - start
+            command = str(args[0]).upper()
+            redis_command_duration.labels(command).observe(elapsed)
+            tracing.record(f"redis.{command}", elapsed)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> Pipeline:
+        return _InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
 
 
 class _RedisClient:
@@ -16,6 +75,45 @@ class _RedisClient:
             self.logger.error(f"Redis connection failed: {e}")
             return False
 
+    async def set_cooldown(self, key: str, seconds: int) -> int:
+        """
+        Start a cooldown unless one is running, in a single round-trip.
+        Returns 0 if it was started, otherwise the seconds left on it.
+        """
+        async with self.r.pipeline(transaction=True) as pipe:
+            pipe.set(key, "1", nx=True, ex=seconds)
+            pipe.ttl(key)
+            started, ttl = await pipe.execute()
+        return 0 if started else max(ttl, 1)
+
+    async def set_with_cooldown(
+        self, cooldown_key: str, cooldown_seconds: int, key: str, value: str, ex: int
+    ) -> int:
+        """
+        Atomically start a cooldown and set key, only if the cooldown was clear.
+        Returns 0 on success, otherwise the seconds left on the cooldown.
+        """
+        time_left = await self.run_script(
+            _SET_WITH_COOLDOWN,
+            keys=[cooldown_key, key],
+            args=[cooldown_seconds, value, ex],
+        )
+        return max(int(time_left), 1) if time_left else 0
+
+    async def claim(self, key: str, expected: str, value: str) -> str | None:
+        """
+        Atomically replace the key's value if it's still expected. Returns the
+        value it held, so the claim succeeded only if that equals expected.
+        """
+        return await self.run_script(_CLAIM, keys=[key], args=[expected, value])
+
+    async def run_script(self, source: str, keys: list, args: list):
+        """Run a Lua script via EVALSHA, loading it on first use"""
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._scripts[source] = self.r.register_script(source)
+        return await script(keys=keys, args=args)
+
     def __new__(cls):
         if not hasattr(cls, "instance"):
             cls.instance = super(_RedisClient, cls).__new__(cls)
@@ -24,9 +122,22 @@ class _RedisClient:
 
     def _init(self):
         self.logger = get_redis_logger()
-        self.logger.info("Initializing Redis...")
+        self._r: redis.Redis | None = None
+        self._scripts: dict[str, AsyncScript] = {}
 
-        self.r = redis.Redis(
+    @property
+    def r(self) -> redis.Redis:
+        if self._r is None:
+            raise RuntimeError("Redis client used before connect()")
+        return self._r
+
+    def connect(self):
+        """Create the client (connections are opened lazily); a no-op if created"""
+        if self._r is not None:
+            return
+
+        self.logger.info("Initializing Redis...")
+        self._r = _InstrumentedRedis(
             host=config.REDIS_HOST,
             port=config.REDIS_PORT,
             db=config.REDIS_DB,
@@ -34,4 +145,14 @@ class _RedisClient:
             decode_responses=True,
         )
 
+    async def close(self):
+        if self._r is None:
+            return
+
+        self.logger.info("Closing Redis...")
+        await self._r.aclose()
+        self._r = None
+        self._scripts.clear()
+
+
 redis_client = _RedisClient()
@@ -0,0 +1,104 @@
+import json
+import logging
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from secrets import token_hex
+from time import perf_counter, time_ns
+
+from config import config
+from logger import get_trace_logger
+
+# Set by TracingMiddleware for every request, sampled or not
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+_trace: ContextVar["_Trace | None"] = ContextVar("trace", default=None)
+_parent_span: ContextVar[str | None] = ContextVar("parent_span", default=None)
+
+trace_logger = get_trace_logger()
+
+
+class _Trace:
+    """Spans of one sampled request, exported together when it finishes"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: list[dict] = []
+
+    def add(self, name: str, span_id: str, start_ns: int, seconds: float, attributes):
+        self.spans.append(
+            {
+                "span_id": span_id,
+                "parent_id": _parent_span.get(),
+                "name": name,
+                "start_ns": start_ns,
+                "duration_ms": seconds * 1000,
+                "attributes": attributes,
+            }
+        )
+
+    def __str__(self) -> str:
+        # Called by the log handler, so serializing stays off the request path
+        return json.dumps(
+            {"trace_id": self.trace_id, "spans": self.spans}, default=str
+        )
+
+
+def start_trace(trace_id: str):
+    """Samples at TRACE_SAMPLE_RATE; pass the result to finish_trace"""
+    if config.TRACE_SAMPLE_RATE <= 0 or random.random() >= config.TRACE_SAMPLE_RATE:
+        return None
+    return _trace.set(_Trace(trace_id))
+
+
+def finish_trace(token):
+    if token is None:
+        return
+    trace = _trace.get()
+    _trace.reset(token)
+    if trace is not None and trace.spans:
+        trace_logger.info("%s", trace)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times the block as a child of the current span. Yields the attributes,
+    which the block may add to; a no-op when the request isn't sampled.
+    """
+    trace = _trace.get()
+    if trace is None:
+        yield attributes
+        return
+
+    span_id = token_hex(8)
+    start_ns = time_ns()
+    start = perf_counter()
+    token = _parent_span.set(span_id)
+    try:
+        yield attributes
+    finally:
+        _parent_span.reset(token)
+        trace.add(name, span_id, start_ns, perf_counter() - start, attributes)
+
+
+def record(name: str, seconds: float, **attributes):
+    """Adds an already-timed leaf span, for hooks that can't wrap a block"""
+    trace = _trace.get()
+    if trace is None:
+        return
+    start_ns = time_ns() - int(seconds * 1e9)
+    trace.add(name, token_hex(8), start_ns, seconds, attributes)
+
+
+_record_factory = logging.getLogRecordFactory()
+
+
+def _record_with_request_id(*args, **kwargs) -> logging.LogRecord:
+    # Stamped when the record is created, before it's queued to another thread
+    log_record = _record_factory(*args, **kwargs)
+    log_record.request_id = request_id.get()
+    return log_record
+
+
+logging.setLogRecordFactory(_record_with_request_id)
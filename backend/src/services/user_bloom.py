@@ -0,0 +1,189 @@
+import math
+from hashlib import blake2b
+
+from redis.exceptions import RedisError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import config
+from logger import get_redis_logger
+from models import User
+from services.redis_client import redis_client
+
+logger = get_redis_logger()
+
+# A Bloom filter of normalized usernames and emails, stored as a Redis
+# bitstring so all workers share it. "Not in the filter" means no such user,
+# so availability checks can answer without Postgres; "maybe" falls through
+# to the usual lookup. Bits are never cleared: deleted users only cause
+# false positives until the next full rebuild, which happens whenever the
+# ready marker expires (USER_BLOOM_REBUILD_INTERVAL) or on demand with
+# `python migrate.py rebuild-user-filter`.
+_REBUILD_BATCH = 1000
+
+# How often each worker checks whether the filter needs rebuilding
+REBUILD_CHECK_SECONDS = 60
+
+# Adds to the live filter, and to the one being rebuilt (if any) so users
+# registered mid-rebuild aren't lost when it replaces the live one
+_ADD = """
+local targets = {KEYS[1]}
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    table.insert(targets, KEYS[2])
+end
+for _, key in ipairs(targets) do
+    for i = 1, #ARGV do
+        redis.call('SETBIT', key, ARGV[i], 1)
+    end
+end
+"""
+
+# Takes the rebuild lock and clears the previous attempt's bitstring in one
+# step, so no add() lands in the rebuild key only to be deleted. Returns 1 if
+# the lock was taken.
+_START_REBUILD = """
+if redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[1]) then
+    redis.call('DEL', KEYS[2])
+    return 1
+end
+return 0
+"""
+
+
+class _BloomStats:
+
+    def __init__(self):
+        # Answered "definitely absent" without a lookup
+        self.hits = 0
+        # "Maybe present" or unavailable, so the lookup ran
+        self.misses = 0
+
+
+stats = _BloomStats()
+
+
+def _size(capacity: int, error_rate: float) -> tuple[int, int]:
+    """Bits and hash count for capacity items at the given false-positive rate"""
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    hashes = max(round(bits / capacity * math.log(2)), 1)
+    return bits, hashes
+
+
+_BITS, _HASHES = _size(config.USER_BLOOM_CAPACITY, config.USER_BLOOM_ERROR_RATE)
+
+# The sizing is part of every key: offsets computed for one size are
+# meaningless against a bitstring built for another, so resizing starts a
+# fresh filter (built at startup) instead of misreading the old one. Users
+# registered by workers still running the old size during a rollout only
+# reach the old filter; run `python migrate.py rebuild-user-filter` once the
+# rollout is done.
+_SIZING = f"{_BITS}:{_HASHES}"
+_FILTER_KEY = f"USER_BLOOM:{_SIZING}"
+_READY_KEY = f"USER_BLOOM_READY:{_SIZING}"
+_REBUILD_KEY = f"USER_BLOOM_REBUILD:{_SIZING}"
+_REBUILD_LOCK_KEY = f"USER_BLOOM_REBUILD_LOCK:{_SIZING}"
+
+
+def _offsets(identifier: str) -> list[int]:
+    # Same username/email split as the lookups, so the two can't collide
+    kind = "EMAIL" if "@" in identifier else "USERNAME"
+    digest = blake2b(f"{kind}:{identifier.lower()}".encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + i * h2) % _BITS for i in range(_HASHES)]
+
+
+async def might_contain(identifier: str) -> bool | None:
+    """
+    False if no user has this username/email, True if one might.
+    None when the filter is disabled, still being built or unreachable.
+    """
+    if not config.USER_BLOOM_ENABLED:
+        return None
+    try:
+        async with redis_client.r.pipeline(transaction=False) as pipe:
+            # Both, in case the filter itself was evicted
+            pipe.exists(_READY_KEY, _FILTER_KEY)
+            for offset in _offsets(identifier):
+                pipe.getbit(_FILTER_KEY, offset)
+            found, *bits = await pipe.execute()
+    except RedisError as e:
+        logger.warning("User filter read failed: %s", e)
+        stats.misses += 1
+        return None
+
+    ready = found == 2
+    if ready and not all(bits):
+        stats.hits += 1
+        return False
+    stats.misses += 1
+    return True if ready else None
+
+
+async def add(*identifiers: str):
+    if not config.USER_BLOOM_ENABLED:
+        return
+    offsets = [offset for i in identifiers for offset in _offsets(i)]
+    try:
+        await redis_client.run_script(
+            _ADD, keys=[_FILTER_KEY, _REBUILD_KEY, _REBUILD_LOCK_KEY], args=offsets
+        )
+    except RedisError as e:
+        # A missing entry would report a taken name as available, so stop
+        # trusting the filter until it's rebuilt
+        logger.error("User filter add failed, disabling it until rebuilt: %s", e)
+        try:
+            await redis_client.r.delete(_READY_KEY)
+        except RedisError:
+            pass
+
+
+async def rebuild(session: AsyncSession, force: bool = False):
+    """
+    Builds the filter from the users table and swaps it in. Skipped if it's
+    already built (unless force) or another worker is building it.
+    """
+    if not config.USER_BLOOM_ENABLED:
+        return
+    r = redis_client.r
+    if not force and await r.exists(_READY_KEY):
+        return
+    if not await redis_client.run_script(
+        _START_REBUILD, keys=[_REBUILD_LOCK_KEY, _REBUILD_KEY], args=[600]
+    ):
+        logger.info("User filter rebuild already in progress")
+        return
+
+    logger.info("Rebuilding user filter...")
+    try:
+        count = 0
+        last_id = 0
+        while True:
+            statement = (
+                select(User.id, User.username, User.email)
+                .where(User.id > last_id)
+                .order_by(User.id)
+                .limit(_REBUILD_BATCH)
+            )
+            rows = (await session.exec(statement)).all()
+            if not rows:
+                break
+            async with r.pipeline(transaction=False) as pipe:
+                for _, username, email in rows:
+                    for offset in (*_offsets(username), *_offsets(email)):
+                        pipe.setbit(_REBUILD_KEY, offset, 1)
+                await pipe.execute()
+            count += len(rows)
+            last_id = rows[-1][0]
+
+        async with r.pipeline(transaction=True) as pipe:
+            # Pad to full size, so an empty table still leaves a filter key
+            pipe.setrange(_REBUILD_KEY, _BITS // 8, b"\0")
+            pipe.rename(_REBUILD_KEY, _FILTER_KEY)
+            # Expiring, so the filter is periodically rebuilt: that clears
+            # deleted users' bits and repairs any add() that was lost
+            pipe.set(_READY_KEY, "1", ex=config.USER_BLOOM_REBUILD_INTERVAL or None)
+            await pipe.execute()
+        logger.info("User filter rebuilt with %d users", count)
+    finally:
+        await r.delete(_REBUILD_LOCK_KEY)
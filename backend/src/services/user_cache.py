@@ -0,0 +1,116 @@
+import json
+from redis.exceptions import RedisError
+
+from config import config
+from logger import get_redis_logger
+from models import User
+from services.redis_client import redis_client
+
+logger = get_redis_logger()
+
+# Stored for identifiers known not to belong to any user
+_NEGATIVE = ""
+
+# Fills the cache from a DB read, unless the identifier was invalidated since
+# the read started (KEYS[1] is its version, ARGV[1] the version seen then),
+# so a lookup racing an update can't cache the pre-update row.
+_PUT = """
+if (redis.call('GET', KEYS[1]) or '') ~= ARGV[1] then
+    return 0
+end
+for i = 2, #KEYS do
+    redis.call('SET', KEYS[i], ARGV[2], 'EX', ARGV[3])
+end
+return 1
+"""
+
+
+class NotCached:
+    """Returned by get() on a miss; pass it to put() with the DB result"""
+
+    def __init__(self, version: str | None):
+        # None when Redis couldn't be read, and put() won't be attempted
+        self.version = version
+
+
+class _CacheStats:
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+
+stats = _CacheStats()
+
+
+def _key(identifier: str) -> str:
+    kind = "EMAIL" if "@" in identifier else "USERNAME"
+    return f"USER_{kind}_{identifier.lower()}"
+
+
+def _version_key(identifier: str) -> str:
+    kind = "EMAIL" if "@" in identifier else "USERNAME"
+    return f"USER_VERSION_{kind}_{identifier.lower()}"
+
+
+async def get(identifier: str) -> User | None | NotCached:
+    """
+    Look up a cached user by username or email. Returns the User (without
+    hashed_password, which isn't cached), None for a cached miss, or NotCached.
+    """
+    try:
+        async with redis_client.r.pipeline(transaction=False) as pipe:
+            pipe.get(_key(identifier))
+            pipe.get(_version_key(identifier))
+            cached, version = await pipe.execute()
+    except RedisError as e:
+        logger.warning("User cache read failed: %s", e)
+        return NotCached(None)
+
+    if cached is None:
+        stats.misses += 1
+        return NotCached(version or "")
+
+    stats.hits += 1
+    if cached == _NEGATIVE:
+        return None
+    return User(**json.loads(cached))
+
+
+async def put(identifier: str, user: User | None, miss: NotCached):
+    """Cache the DB result for the lookup get() reported as miss"""
+    if miss.version is None:
+        return
+    if user is None:
+        keys = [_key(identifier)]
+        payload, ttl = _NEGATIVE, config.USER_CACHE_NEGATIVE_TTL
+    else:
+        # Under both identifiers so either lookup hits. The password hash
+        # stays out of Redis; validate_credentials reads it from the DB.
+        keys = [_key(user.email), _key(user.username)]
+        payload = user.model_dump_json(exclude={"hashed_password"})
+        ttl = config.USER_CACHE_TTL
+    try:
+        await redis_client.run_script(
+            _PUT,
+            keys=[_version_key(identifier), *keys],
+            args=[miss.version, payload, ttl],
+        )
+    except RedisError as e:
+        logger.warning("User cache write failed: %s", e)
+
+
+async def invalidate(*identifiers: str):
+    """Drop the entries and bump their versions, voiding fills still in flight"""
+    identifiers = tuple({i.lower() for i in identifiers})
+    try:
+        async with redis_client.r.pipeline(transaction=False) as pipe:
+            pipe.delete(*(_key(i) for i in identifiers))
+            for identifier in identifiers:
+                pipe.incr(_version_key(identifier))
+                # Only has to outlive a DB read, but expiring with the
+                # entries keeps it simple
+                pipe.expire(_version_key(identifier), config.USER_CACHE_TTL)
+            await pipe.execute()
+    except RedisError as e:
+        logger.error("User cache invalidation failed: %s", e)